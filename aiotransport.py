@@ -0,0 +1,278 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+
+from cache import CachedResponse
+from metrics import METRICS
+from transport import (
+    Breakers, last_good, RateLimits, settings, Transport, UpstreamDown)
+
+# aiohttp is looked up without importing it, and only loaded when the first
+# request is sent
+HAVE_AIOHTTP = find_spec('aiohttp') is not None
+
+
+def blocking(executor, function, *args, **kwargs):
+    r"""
+    Run a blocking call without holding up the event loop
+
+    The call runs in a copy of the current context, so the timings it records
+    keep the labels of the request being answered.
+
+    :param executor: Executor to run the call in. The event loop's default
+                     executor is used when ``None``.
+    :param function: Function to call
+    :return: Future of the call's result
+    """
+    return asyncio.get_running_loop().run_in_executor(
+        executor, partial(copy_context().run, function, *args, **kwargs))
+
+
+class AsyncSingleFlight(object):
+    r"""
+    Share one in-flight coroutine between all callers asking for the same key
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, function, *args, **kwargs):
+        r"""
+        Await ``function`` unless a call for ``key`` is already running, in
+        which case wait for it and return (or raise) its outcome instead
+
+        :param key: Hashable identifier of the call
+        :param function: Coroutine function to call
+        """
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = asyncio.ensure_future(
+                function(*args, **kwargs))
+            call.add_done_callback(lambda _: self.calls.pop(key, None))
+        # One caller giving up must not cancel the call for everyone else
+        return await asyncio.shield(call)
+
+
+class AsyncTransport(object):
+    r"""
+    Asynchronous HTTP client for every upstream the bot talks to
+
+    It mirrors :class:`transport.Transport`: one keep-alive connection pool,
+    retries with backoff, per-host rate limits, the response cache and
+    shared in-flight lookups, per-host circuit breakers and serving the last
+    good response while a host is down. Every method is a coroutine, so one
+    process can keep many upstream requests in flight. Requires aiohttp.
+
+    :param int pool_connections: Number of hosts connections are kept to
+    :param int pool_maxsize: Connections kept alive to each host
+    :param float timeout: Seconds to wait for a response
+    :param float connect_timeout: Seconds to wait for a connection
+    :param int retries: Attempts made on connection errors and 5xx replies
+    :param float backoff: Backoff factor applied between retries
+    :param cache: Optional :class:`cache.ResponseCache` for keyed lookups
+    :param float rate: Requests per second allowed to each host. No limit is
+                       applied when 0.
+    :param int burst: Requests a host may receive at once before ``rate``
+                      applies
+    :param int failures: Failed requests in a row that open a host's circuit.
+                         Circuits never open when 0.
+    :param float cooldown: Seconds a host's circuit stays open
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=8, timeout=10.0,
+                 retries=2, backoff=0.5, cache=None, rate=0, burst=10,
+                 connect_timeout=3.0, failures=5, cooldown=60):
+        if not HAVE_AIOHTTP:
+            raise RuntimeError('AsyncTransport requires aiohttp')
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.limits = RateLimits(rate, burst)
+        self.breakers = Breakers(failures, cooldown)
+        self.flights = AsyncSingleFlight()
+        self.session = None
+
+    @classmethod
+    def from_config(cls, section, cache=None):
+        r"""
+        Build a transport from a configuration section
+
+        :param section: ``ConfigParser`` section holding the pool settings
+        :param cache: Optional :class:`cache.ResponseCache` to read through
+        """
+        return cls(cache=cache, **settings(section))
+
+    async def throttle(self, url):
+        r"""
+        Wait until the host serving ``url`` may receive another request
+
+        :param str url: URL about to be requested
+        """
+        bucket = self.limits.bucket(url)
+        if bucket is None:
+            return
+        delay = bucket.reserve()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = bucket.reserve()
+
+    async def get(self, url, params=None, key=None):
+        r"""
+        Issue a GET request, answering from the cache when possible
+
+        Only successful responses are cached, so errors are always retried on
+        the next request. Concurrent requests for the same key share a single
+        upstream request. Time spent waiting on the upstream is recorded as the
+        ``fetch`` stage, labelled with its host.
+
+        :param str url: URL to fetch
+        :param dict params: Query string parameters
+        :param tuple key: Cache key built with :func:`cache.cache_key`. When
+                          omitted the request always goes upstream.
+        :return: :class:`cache.CachedResponse`
+        """
+        if key is not None and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        with METRICS.timer('fetch', host=urlsplit(url).netloc):
+            try:
+                if key is None:
+                    r = await self.fetch(url, params, key)
+                else:
+                    r = await self.flights.do(
+                        key, self.fetch, url, params, key)
+            except IOError:
+                stale = last_good(self.cache, key)
+                if stale is None:
+                    raise
+                return stale
+        if r.status_code >= 500:
+            return last_good(self.cache, key) or r
+        return r
+
+    async def refresh(self, url, params=None, key=None):
+        r"""
+        Fetch ``url`` even if the cache holds it, replacing the cached entry
+
+        :param str url: URL to fetch
+        :param dict params: Query string parameters
+        :param tuple key: Cache key built with :func:`cache.cache_key`
+        """
+        with METRICS.timer('prefetch', host=urlsplit(url).netloc):
+            if key is None:
+                return await self.fetch(url, params, key)
+            return await self.flights.do(key, self.fetch, url, params, key)
+
+    async def fetch(self, url, params=None, key=None):
+        import aiohttp
+        breaker = self.breakers.breaker(url)
+        if not breaker.allow():
+            raise UpstreamDown(urlsplit(url).netloc)
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_connections * self.pool_maxsize,
+                    limit_per_host=self.pool_maxsize),
+                timeout=aiohttp.ClientTimeout(
+                    total=self.timeout, sock_connect=self.connect_timeout))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            await self.throttle(url)
+            try:
+                async with self.session.get(url, params=params) as r:
+                    r = CachedResponse(r.status, await r.read(), str(r.url))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt == self.retries:
+                    breaker.failure()
+                    # Raised as IOError, like the errors of requests
+                    raise IOError(
+                        'GET {} failed: {!r}'.format(url, error)) from error
+                continue
+            if r.status_code not in (500, 502, 503, 504):
+                break
+        if r.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        if key is not None and self.cache is not None and \
+                r.status_code == 200:
+            self.cache.set(key, r)
+        return r
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.cache is not None:
+            self.cache.close()
+
+
+class ThreadedTransport(object):
+    r"""
+    Coroutine interface to a blocking :class:`transport.Transport`
+
+    Each request runs in a thread pool of its own, so handlers can await it
+    without blocking other requests. The pool has one thread per pooled
+    connection, so as many requests are in flight as without the wrapper,
+    whatever the size of the event loop's default executor. Used when aiohttp
+    is not installed and to run the coroutine handlers over a plain
+    transport.
+
+    :param transport: :class:`transport.Transport` to send requests with
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.executor = ThreadPoolExecutor(
+            max_workers=transport.pool_connections * transport.pool_maxsize)
+
+    @property
+    def cache(self):
+        return self.transport.cache
+
+    async def get(self, url, params=None, key=None):
+        return await blocking(
+            self.executor, self.transport.get, url, params, key)
+
+    async def refresh(self, url, params=None, key=None):
+        return await blocking(
+            self.executor, self.transport.refresh, url, params, key)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.transport.close()
+
+
+def asynchronous(session):
+    r"""
+    Return a transport whose methods are coroutines
+
+    :param session: :class:`AsyncTransport`, :class:`ThreadedTransport` or
+                    :class:`transport.Transport`
+    """
+    if isinstance(session, Transport):
+        return ThreadedTransport(session)
+    return session
+
+
+def from_config(section, cache=None):
+    r"""
+    Build the best transport available from a configuration section
+
+    :param section: ``ConfigParser`` section holding the pool settings
+    :param cache: Optional :class:`cache.ResponseCache` to read through
+    :return: :class:`AsyncTransport` if aiohttp is installed, otherwise a
+             :class:`ThreadedTransport`
+    """
+    if HAVE_AIOHTTP:
+        return AsyncTransport.from_config(section, cache)
+    return ThreadedTransport(Transport.from_config(section, cache))
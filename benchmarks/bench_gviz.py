@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the wotinfo vehicle table extraction.
+#
+# Usage: bench_gviz.py [-n RUNS] [PAGE ...]
+#
+# PAGE is a saved http://wotinfo.net/en/vehicles page, ideally of an account
+# with several hundred vehicles. Without any pages a synthetic 450 vehicle
+# page is generated instead.
+from argparse import ArgumentParser
+from json import loads
+import os
+import random
+from re import findall
+import sys
+from timeit import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import gviz  # noqa: E402
+
+
+def legacy(text):
+    # The JSON rewriting parser gviz replaced, kept for comparison
+    ranks = {
+        'rank_01.png': '1',
+        'rank_02.png': '2',
+        'rank_03.png': '3',
+        'rank_m.png': 'M',
+        'FFFFFF-0.png': ''
+    }
+    rows = []
+    for row in findall(r'data\.addRow\([^\;]+;', text):
+        r = loads('{ "data": ' + row[12:-2].replace(
+            '"', '!').replace(
+            "'", '"').replace(
+            '!', "'").replace(
+            'v:', '"v":').replace(
+            'f:', '"f":') + '}')['data']
+        rows.append([
+            r[0],
+            ranks[r[1].split("'")[1].split('/')[-1]],
+            r[3].split('>')[1][:-3],
+            r[5].split("'")[-2].split('/')[-1].split('.')[0],
+            r[6]['f'], r[7], r[8], r[9], r[10]['f'], r[11]['v'],
+            r[12]['v']])
+    return rows
+
+
+def synthetic(count=450, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        battles = rng.randint(1, 3000)
+        wins = rng.randint(0, battles)
+        rows.append(
+            "data.addRow([{tier}, '<img src=\"/images/{rank}\">', 'v{i}', "
+            "'<a href=\"/en/tank?id={i}\">Tank {i}</a>', '', "
+            "'<img src=\"/images/{kind}.png\">', "
+            "{{v: {rate:.4f}, f: '{pct:.2f}%'}}, {wins}, {battles}, {dmg}, "
+            "{{v: {share:.4f}, f: '{share:.2f}%'}}, "
+            "{{v: {eff}, f: '{eff}'}}, {{v: {wn8}, f: '{wn8}'}}]);".format(
+                tier=rng.randint(1, 10),
+                rank=rng.choice(list(gviz.RANKS)),
+                i=i,
+                kind=rng.choice(('lightTank', 'mediumTank', 'heavyTank',
+                                 'AT-SPG', 'SPG')),
+                rate=wins / battles,
+                pct=100.0 * wins / battles,
+                wins=wins,
+                battles=battles,
+                dmg=rng.randint(50, 4000),
+                share=rng.random(),
+                eff=rng.randint(300, 2500),
+                wn8=rng.randint(100, 4000)))
+    return (
+        '<html><head><script>\nfunction drawTable() {\n'
+        'var data = new google.visualization.DataTable();\n' +
+        '\n'.join(rows) + '\n}\n</script></head><body></body></html>')
+
+
+def main():
+    parser = ArgumentParser(
+        description='Benchmark wotinfo vehicle table extraction')
+    parser.add_argument('pages', nargs='*', help='Saved vehicles pages')
+    parser.add_argument('-n', '--runs', type=int, default=50)
+    args = parser.parse_args()
+    pages = []
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read().decode('utf8')))
+    if not pages:
+        pages.append(('synthetic-450', synthetic()))
+    print('{:<24} {:>6} {:>12} {:>12} {:>8}'.format(
+        'page', 'rows', 'legacy (ms)', 'gviz (ms)', 'speedup'))
+    for name, text in pages:
+        rows = gviz.vehicles(text)
+        if [list(r) for r in rows] != legacy(text):
+            print('{}: parsers disagree!'.format(name))
+        old = min(repeat(lambda: legacy(text), number=1, repeat=args.runs))
+        new = min(repeat(lambda: gviz.vehicles(text), number=1,
+                         repeat=args.runs))
+        print('{:<24} {:>6} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            name[:24], len(rows), old * 1000, new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Compare HTML parsing backends on saved wotinfo pages.
+#
+# Usage: bench_parse.py [-n RUNS] [--summary PAGE] [--recent PAGE]
+#                       [--trend PAGE]
+#
+# Each page is parsed in full and with only the subtrees the bot reads, with
+# every available tree builder. Parse time is the best of RUNS and peak memory
+# is measured with tracemalloc over a single parse.
+from argparse import ArgumentParser
+import os
+import sys
+from timeit import repeat
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import wotinfo  # noqa: E402
+
+
+def parsers():
+    found = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        found.insert(0, 'lxml')
+    return found
+
+
+def peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = ArgumentParser(
+        description='Compare HTML parsing backends on saved wotinfo pages')
+    parser.add_argument('--summary', help='Saved efficiency page')
+    parser.add_argument('--recent', help='Saved recent page')
+    parser.add_argument('--trend', help='Saved trend page')
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    args = parser.parse_args()
+    pages = [
+        ('summary', args.summary, wotinfo.SUMMARY_PARTS),
+        ('recent', args.recent, wotinfo.RECENT_PARTS),
+        ('trend', args.trend, wotinfo.TREND_PARTS),
+    ]
+    if not any(path for _, path, _ in pages):
+        parser.error('at least one saved page is required')
+    print('{:<8} {:<12} {:<8} {:>10} {:>12}'.format(
+        'page', 'parser', 'mode', 'time (ms)', 'peak (KiB)'))
+    for kind, path, parts in pages:
+        if not path:
+            continue
+        with open(path, 'rb') as f:
+            content = f.read()
+        for name in parsers():
+            for mode, strainer in (('full', None), ('strained', parts)):
+                def parse():
+                    wotinfo.parse_page(content, strainer, name)
+                best = min(repeat(parse, number=1, repeat=args.runs))
+                print('{:<8} {:<12} {:<8} {:>10.3f} {:>12.1f}'.format(
+                    kind, name, mode, best * 1000, peak(parse) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Time how long the bot takes to start for runs that need little work.
+#
+# Usage: bench_startup.py [-n RUNS]
+#
+# Each scenario runs in a fresh interpreter, as it would under cron. Wall time
+# includes interpreter startup; "python" alone is shown for reference. The
+# heavy dependencies each scenario ended up importing are listed, so a change
+# that loads one eagerly again is easy to spot. The empty inbox scenario runs
+# bot.py as cron would, with a generated configuration file, but with praw's
+# Reddit replaced by one whose inbox is empty, so it needs no network. Every
+# scenario runs in a scratch directory, where the journal, history and log
+# files end up.
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+ROOT = os.path.dirname(HERE)
+BOT = os.path.join(ROOT, 'bot.py')
+CONFIG = 'bench.ini'
+HEAVY = ('aiohttp', 'bs4', 'lxml', 'praw', 'requests')
+EMPTY_INBOX = '\n'.join((
+    'import praw',
+    'import runpy',
+    'class Inbox(object):',
+    '    def unread(self, limit=None):',
+    '        return iter(())',
+    'class Reddit(object):',
+    '    def __init__(self, site_name):',
+    '        self.inbox = Inbox()',
+    'praw.Reddit = Reddit',
+    'sys.argv = [{!r}, {!r}]'.format(BOT, CONFIG),
+    'runpy.run_path({!r}, run_name="__main__")'.format(BOT),
+))
+SCENARIOS = (
+    ('python', 'pass'),
+    ('import bot', 'import bot'),
+    ('empty inbox', EMPTY_INBOX),
+    ('help', 'import bot\nbot.parse(Mention("/u/wotc_bot help"), None)'),
+    ('good bot', 'import bot\nbot.parse(Mention("good bot"), None)'),
+)
+REPORT = (
+    '\nprint(",".join(name for name in {!r} if name in sys.modules))'
+).format(HEAVY)
+
+
+def child(code):
+    return '\n'.join((
+        'import sys',
+        'sys.path.insert(0, {!r})'.format(ROOT),
+        'sys.path.insert(0, {!r})'.format(HERE),
+        'from standin import Mention',
+        code,
+        REPORT))
+
+
+def measure(code, runs, cwd):
+    r"""
+    Run a scenario in fresh interpreters
+
+    :param str code: Source run after the bot directory is importable
+    :param int runs: Number of interpreters to start
+    :param str cwd: Directory to run in
+    :return: Tuple of wall times (seconds) and the heavy modules imported, or
+             ``None`` and the error if the scenario failed
+    """
+    times = []
+    loaded = ''
+    for _ in range(runs):
+        start = perf_counter()
+        done = subprocess.run(
+            [sys.executable, '-c', child(code)], cwd=cwd,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        times.append(perf_counter() - start)
+        if done.returncode:
+            return None, done.stderr.strip().splitlines()[-1]
+        loaded = done.stdout.strip().splitlines()[-1:]
+    return sorted(times), ','.join(loaded)
+
+
+def main():
+    parser = ArgumentParser(
+        description='Time bot startup for runs that need little work')
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    args = parser.parse_args()
+    print('{:<14} {:>9} {:>9}  {}'.format(
+        'scenario', 'min (ms)', 'p50 (ms)', 'heavy imports'))
+    with TemporaryDirectory() as scratch:
+        subprocess.run(
+            [sys.executable, BOT, '--generate', CONFIG], cwd=scratch,
+            check=True)
+        for name, code in SCENARIOS:
+            times, loaded = measure(code, args.runs, scratch)
+            if times is None:
+                print('{:<14} failed: {}'.format(name, loaded))
+                continue
+            print('{:<14} {:>9.1f} {:>9.1f}  {}'.format(
+                name, times[0] * 1000, times[len(times) // 2] * 1000,
+                loaded or '-'))
+
+
+if __name__ == '__main__':
+    main()
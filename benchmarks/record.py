@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Record upstream responses for the offline benchmarks.
+#
+# Usage: record.py [--platform PLAT] [--player NAME] [--clan TAG]
+#                  [--tank TANK] [FIXTURES]
+#
+# Every command in commands.txt is run once against the live sites and each
+# response is saved, with an index, for standin.py to replay. Pick a veteran
+# player and a large clan so the fixtures exercise the expensive paths.
+from argparse import ArgumentParser
+from hashlib import sha1
+from json import dump, load
+import os
+import sys
+
+from requests import Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import bot  # noqa: E402
+from standin import (  # noqa: E402
+    fixture_key, FIXTURES, INDEX, load_commands, Mention)
+from transport import Transport  # noqa: E402
+
+
+class RecordingTransport(Transport):
+    r"""
+    Transport that saves every response it receives
+
+    :param str root: Directory to write the fixtures to
+    """
+
+    def __init__(self, root, **kwargs):
+        super(RecordingTransport, self).__init__(**kwargs)
+        self.root = root
+        self.index = {}
+        if os.path.exists(os.path.join(root, INDEX)):
+            with open(os.path.join(root, INDEX)) as f:
+                self.index = load(f)
+
+    def fetch(self, url, params=None, key=None, **kwargs):
+        r = super(RecordingTransport, self).fetch(url, params, key, **kwargs)
+        request = Request('GET', url, params=params).prepare()
+        parts = request.path_url.partition('?')
+        name = fixture_key(
+            request.url.split('/')[2], parts[0], parts[2])
+        content_type = r.headers.get('Content-Type', 'text/html')
+        filename = '{}.{}'.format(
+            sha1(name.encode('utf8')).hexdigest()[:16],
+            'json' if 'json' in content_type else 'html')
+        with open(os.path.join(self.root, filename), 'wb') as f:
+            f.write(r.content)
+        self.index[name] = {
+            'file': filename,
+            'status': r.status_code,
+            'type': content_type,
+        }
+        return r
+
+    def save(self):
+        with open(os.path.join(self.root, INDEX), 'w') as f:
+            dump(self.index, f, indent=1, sort_keys=True)
+
+
+def main():
+    parser = ArgumentParser(
+        description='Record upstream responses for the offline benchmarks')
+    parser.add_argument('fixtures', nargs='?', default=FIXTURES)
+    parser.add_argument('--platform', default='xbox')
+    parser.add_argument('--player', default='DEZERTstorm03')
+    parser.add_argument('--clan', default='RDDT')
+    parser.add_argument('--tank', default='IS-7')
+    args = parser.parse_args()
+    if not os.path.isdir(args.fixtures):
+        os.makedirs(args.fixtures)
+    session = RecordingTransport(args.fixtures)
+    for command in load_commands(
+            platform=args.platform, player=args.player, clan=args.clan,
+            tank=args.tank):
+        print(command)
+        bot.parse(Mention(command), session)
+    session.save()
+    print('Recorded {} responses to {}'.format(
+        len(session.index), args.fixtures))
+
+
+if __name__ == '__main__':
+    main()
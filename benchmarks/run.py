@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Offline end-to-end benchmark of every bot command.
+#
+# Usage: run.py [-n ITERATIONS] [--warmup N] [--cache] [--platform PLAT]
+#               [--player NAME] [--clan TAG] [--tank TANK] [FIXTURES]
+#
+# Starts standin.py on the fixtures saved by record.py, then runs each command
+# from commands.txt through parse() in its own process so that peak RSS is
+# reported per command. Use the same names as when recording.
+from argparse import ArgumentParser
+from json import dumps, loads
+import os
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from standin import FIXTURES, load_commands, Mention  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(base, command, iterations, warmup, cache):
+    r"""
+    Time one command against the stand-in server
+
+    :param str base: Stand-in server address
+    :param str command: Mention body to parse
+    :param int iterations: Timed runs
+    :param int warmup: Untimed runs made first
+    :param bool cache: Keep a response cache across runs
+    :return: Dictionary of latencies (seconds) and peak RSS (KiB)
+    """
+    import bot
+    from cache import ResponseCache
+    from standin import ReplayTransport
+    session = ReplayTransport(base, cache=ResponseCache() if cache else None)
+    message = Mention(command)
+    for _ in range(warmup):
+        bot.parse(message, session)
+    latencies = []
+    start = perf_counter()
+    for _ in range(iterations):
+        began = perf_counter()
+        bot.parse(message, session)
+        latencies.append(perf_counter() - began)
+    total = perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return {'latencies': latencies, 'total': total, 'rss': rss}
+
+
+def main():
+    parser = ArgumentParser(
+        description='Benchmark every bot command against recorded fixtures')
+    parser.add_argument('fixtures', nargs='?', default=FIXTURES)
+    parser.add_argument('-n', '--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep a response cache between iterations')
+    parser.add_argument('--platform', default='xbox')
+    parser.add_argument('--player', default='DEZERTstorm03')
+    parser.add_argument('--clan', default='RDDT')
+    parser.add_argument('--tank', default='IS-7')
+    parser.add_argument('--worker', nargs=2, metavar=('BASE', 'COMMAND'),
+                        help='Internal: measure one command and print JSON')
+    args = parser.parse_args()
+    if args.worker:
+        print(dumps(measure(args.worker[0], args.worker[1], args.iterations,
+                            args.warmup, args.cache)))
+        return
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), 'standin.py'),
+         args.fixtures],
+        stdout=subprocess.PIPE, universal_newlines=True)
+    try:
+        base = server.stdout.readline().strip()
+        print('{:<48} {:>9} {:>9} {:>9} {:>10}'.format(
+            'command', 'p50 (ms)', 'p99 (ms)', 'req/s', 'RSS (MiB)'))
+        for command in load_commands(
+                platform=args.platform, player=args.player, clan=args.clan,
+                tank=args.tank):
+            worker = [sys.executable, __file__, '--worker', base, command,
+                      '-n', str(args.iterations),
+                      '--warmup', str(args.warmup)]
+            if args.cache:
+                worker.append('--cache')
+            result = loads(subprocess.check_output(
+                worker, universal_newlines=True))
+            latencies = result['latencies']
+            print('{:<48} {:>9.2f} {:>9.2f} {:>9.1f} {:>10.1f}'.format(
+                command[:48],
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                len(latencies) / result['total'],
+                result['rss'] / 1024.0))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
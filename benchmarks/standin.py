@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Local stand-in for wotinfo.net and wotclans.com.br.
+#
+# Usage: standin.py [-p PORT] [FIXTURES]
+#
+# Serves the pages recorded by record.py. A request for
+# http://127.0.0.1:PORT/<host>/<path>?<query> is answered with the fixture
+# recorded for http(s)://<host>/<path>?<query>, or a 404 if there is none.
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import load
+import os
+import sys
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from transport import Transport  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+INDEX = 'index.json'
+COMMANDS = os.path.join(os.path.dirname(__file__), os.pardir, 'commands.txt')
+
+
+class Mention(object):
+    # The only part of a praw message parse() looks at
+
+    def __init__(self, body):
+        self.body = body
+
+
+def load_commands(path=COMMANDS, platform='xbox', player='DEZERTstorm03',
+                  clan='RDDT', tank='IS-7', bot='/u/wotc_bot'):
+    r"""
+    Turn the command reference into concrete mentions
+
+    Lines with optional arguments are skipped, as their plain forms are
+    already listed.
+
+    :param str path: Command reference, one ``BOT ...`` command per line
+    :param str platform: Platform substituted for PLAT
+    :param str player: Player substituted for NAME in player commands
+    :param str clan: Clan tag substituted for NAME in clan commands
+    :param str tank: Tank substituted for TANK
+    :param str bot: Mention substituted for BOT
+    """
+    commands = []
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if len(words) < 2 or words[0] != 'BOT' or words[1] == ':=' or \
+                    '[' in line:
+                continue
+            name = clan if words[1] == 'clan' else player
+            commands.append(' '.join(
+                {'BOT': bot, 'PLAT': platform, 'NAME': name, 'TANK': tank}.get(
+                    word, word)
+                for word in words))
+    return commands
+
+
+def fixture_key(host, path, query):
+    r"""
+    Identify a recorded request regardless of scheme and parameter order
+
+    :param str host: Host name the request was sent to
+    :param str path: Request path
+    :param str query: Encoded query string
+    """
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return '{}{}?{}'.format(host.lower(), path, query)
+
+
+class ReplayTransport(Transport):
+    r"""
+    Transport that sends every request to a local stand-in server
+
+    :param str base: Stand-in server address, e.g. ``http://127.0.0.1:8000``
+    """
+
+    def __init__(self, base, **kwargs):
+        super(ReplayTransport, self).__init__(**kwargs)
+        self.base = base.rstrip('/')
+
+    def fetch(self, url, params=None, key=None, **kwargs):
+        parts = urlsplit(url)
+        local = '{}/{}{}'.format(self.base, parts.netloc, parts.path)
+        if parts.query:
+            local += '?' + parts.query
+        return super(ReplayTransport, self).fetch(
+            local, params, key, **kwargs)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        entry = self.server.index.get(
+            fixture_key(host, '/' + path, parts.query))
+        if entry is None:
+            self.send_error(404)
+            return
+        with open(os.path.join(self.server.root, entry['file']), 'rb') as f:
+            body = f.read()
+        self.send_response(entry['status'])
+        self.send_header('Content-Type', entry['type'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(root=FIXTURES, port=0):
+    r"""
+    Create a stand-in server for the fixtures in ``root``
+
+    :param str root: Directory holding the recorded fixtures
+    :param int port: Port to listen on. 0 picks a free port.
+    :return: Server that has not been started yet
+    """
+    with open(os.path.join(root, INDEX)) as f:
+        index = load(f)
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.root = root
+    server.index = index
+    return server
+
+
+def main():
+    parser = ArgumentParser(
+        description='Serve recorded upstream fixtures locally')
+    parser.add_argument('fixtures', nargs='?', default=FIXTURES)
+    parser.add_argument('-p', '--port', type=int, default=0)
+    args = parser.parse_args()
+    server = serve(args.fixtures, args.port)
+    print('http://127.0.0.1:{}'.format(server.server_address[1]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
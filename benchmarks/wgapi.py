@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Local mock of the World of Tanks Console API.
+#
+# Usage: wgapi.py [-p PORT]
+#
+# Answers account/list, account/info and tanks/stats with synthetic data, so
+# the commands using the API can be tested (tests/test_wargaming.py) and
+# benchmarked offline. Point
+# standin.ReplayTransport at the printed address: a request for
+# http://127.0.0.1:PORT/<host>/wotx/<method>/ is answered as the API at <host>
+# would. Every name exists except those starting with "missing", and the same
+# name always gets the same account and stats. Requests without an
+# application_id, or with more than 100 names or IDs, get the error answers
+# the real API sends.
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from random import Random
+from urllib.parse import parse_qs, urlsplit
+from zlib import crc32
+
+LIMIT = 100
+TANK_IDS = tuple(range(1, 64 * 256, 256))
+
+
+def account_id(name):
+    return 1000000000 + crc32(name.lower().encode('utf8')) % 100000000
+
+
+def statistics(seed, battles):
+    rng = Random(seed)
+    wins = int(battles * rng.uniform(0.45, 0.65))
+    return {
+        'battles': battles,
+        'wins': wins,
+        'damage_dealt': int(battles * rng.uniform(500, 3000)),
+        'frags': int(battles * rng.uniform(0.5, 1.5)),
+        'spotted': int(battles * rng.uniform(0.5, 2.0)),
+        'dropped_capture_points': int(battles * rng.uniform(0.2, 1.0)),
+        'capture_points': int(battles * rng.uniform(0.2, 1.5)),
+    }
+
+
+def tanks(id):
+    rng = Random(id)
+    return [
+        {'tank_id': tank, 'all': statistics(id ^ tank, rng.randint(1, 500))}
+        for tank in rng.sample(TANK_IDS, 20)]
+
+
+def account(id):
+    played = tanks(id)
+    totals = {}
+    for tank in played:
+        for field, value in tank['all'].items():
+            totals[field] = totals.get(field, 0) + value
+    return {
+        'account_id': id,
+        'nickname': 'player{}'.format(id),
+        'statistics': {'all': totals},
+    }
+
+
+def error(code, message, field=None, value=None):
+    return {'status': 'error', 'error': {
+        'code': code, 'message': message, 'field': field, 'value': value}}
+
+
+def answer(method, query):
+    r"""
+    Build the API's answer to a request
+
+    :param str method: API method, e.g. ``account/list``
+    :param dict query: Query string, as parsed by ``parse_qs``
+    :return: Decoded JSON answer
+    """
+    get = lambda field: query.get(field, [''])[0]  # noqa: E731
+    if not get('application_id'):
+        return error(402, 'APPLICATION_ID_NOT_SPECIFIED', 'application_id')
+    if method == 'account/list':
+        names = [name for name in get('search').split(',') if name]
+        if len(names) > LIMIT:
+            return error(407, 'SEARCH_LIST_LIMIT_EXCEEDED', 'search')
+        data = [
+            {'nickname': name, 'account_id': account_id(name)}
+            for name in names if not name.lower().startswith('missing')]
+    elif method == 'account/info':
+        ids = [int(id) for id in get('account_id').split(',') if id]
+        if len(ids) > LIMIT:
+            return error(407, 'ACCOUNT_ID_LIST_LIMIT_EXCEEDED', 'account_id')
+        data = {str(id): account(id) for id in ids}
+    elif method == 'tanks/stats':
+        id = int(get('account_id') or 0)
+        data = {str(id): tanks(id)}
+    else:
+        return error(404, 'METHOD_NOT_FOUND', 'method', method)
+    return {'status': 'ok', 'meta': {'count': len(data)}, 'data': data}
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        # /<host>/wotx/<method>/
+        method = '/'.join(parts.path.strip('/').split('/')[2:])
+        body = dumps(answer(method, parse_qs(parts.query))).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0):
+    r"""
+    Create a mock API server
+
+    :param int port: Port to listen on. 0 picks a free port.
+    :return: Server that has not been started yet
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = ArgumentParser(
+        description='Serve a mock World of Tanks Console API locally')
+    parser.add_argument('-p', '--port', type=int, default=0)
+    args = parser.parse_args()
+    server = serve(args.port)
+    print('http://127.0.0.1:{}'.format(server.server_address[1]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
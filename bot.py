@@ -1,21 +1,87 @@
 #!/usr/bin/env python3
+import aiotransport
+from aiotransport import blocking
 from argparse import ArgumentParser
-from bs4 import BeautifulSoup
+import asyncio
+from cache import cache_key, ResponseCache
+from catalog import REQUIRED, TANK_URLS, TankCatalogs
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
+from datetime import datetime, timezone
+from dispatch import Command, Request, resolve, Subcommand
+from history import History
 from itertools import zip_longest
-from json import loads
+from journal import Journal
 from json.decoder import JSONDecodeError
+import gviz
 import logging
 import logging.handlers
-from operator import itemgetter
-from praw import Reddit
-from re import findall
-from requests import get
+from metrics import METRICS, serve_metrics
+from operator import attrgetter
+from prefetch import Prefetcher
+from ranking import rankings, top
+from render import (
+    CLAN_ACTIVE_ROW, CLAN_BATTLES_ROW, CLAN_COMPARE, CLAN_GROWTH, CLAN_HEADS,
+    CLAN_MONTH_ROW, CLAN_PLAYERS_ROW, CLAN_TIER_ROW, CLAN_TIERS_ROW,
+    CLAN_TOP_FIELD, CLAN_TOP_MONTH, CLAN_TOP_TOTAL, CLAN_TOTAL_ROW, GROWTH_ROW,
+    MarkdownWriter, PLAYER_ACCOUNT, PLAYER_COMPARE, PLAYER_EFFICIENCY,
+    PLAYER_PROGRESS, PLAYER_RATINGS, PLAYER_RECENT, PLAYER_SUMMARY,
+    PLAYER_TANKS, PROGRESS_ROW, RATING_ROW, RECENT_ROW, TANK_CHOICE_ROW,
+    TANK_CHOICES, TANK_INFO, TANK_ROW, TREND_ROW)
+from roster import Clan
+from signal import SIGINT, SIGTERM
+from time import monotonic, time
+from transport import SERVED_STALE, served_stale, UpstreamDown
+from urllib.parse import urlencode
+from wargaming import WargamingAPI, WargamingError
+from wotinfo import (
+    known_player_id, parse_page, player_page, RECENT_PARTS, RECENT_URL,
+    TREND_PARTS, TREND_URL, VEHICLES_URL)
 # from sys import argv
-from urllib.parse import urlsplit, parse_qs
 # from wotconsole.session import WOTXSession
 
 _WG_API_KEY_ = 'demo'
+_WARGAMING_ = WargamingAPI(_WG_API_KEY_)
+_CATALOGS_ = TankCatalogs()
+# Fields "player PLAT tanks top by FIELD" can sort on
+TANK_FIELDS = {
+    'battles': attrgetter('battles'),
+    'damage': attrgetter('damage'),
+    'efficiency': attrgetter('efficiency'),
+    'tier': attrgetter('tier'),
+    'wins': attrgetter('wins'),
+    'wn8': attrgetter('wn8'),
+}
+# Fields "clan PLAT top by FIELD" can sort on, with their column titles and
+# the compiled template of their rows
+CLAN_FIELDS = {
+    'battles': ('MonthBattles', 'Month\'s battles', CLAN_BATTLES_ROW),
+    'month': ('MonthWn8', 'Month\'s WN8', CLAN_MONTH_ROW),
+    'tier': ('TotalTier', 'Lifetime tier average', CLAN_TIER_ROW),
+    'wn8': ('TotalWn8', 'Lifetime WN8', CLAN_TOTAL_ROW),
+}
+# Clan lookup endpoint, by platform
+CLAN_URLS = {
+    'ps': 'https://ps.wotclans.com.br/api/clan/',
+    'xbox': 'https://wotclans.com.br/api/clan/',
+}
+_PREFETCH_ = Prefetcher(CLAN_URLS, _CATALOGS_)
+# Seconds between journal prunes in daemon mode
+JOURNAL_PRUNE = 3600
+# Seconds between rereads of the whole unread inbox in daemon mode, to retry
+# the mentions the stream has already handed out once
+INBOX_REDRAIN = 600
+# History of looked up player and clan stats, if one is kept
+_HISTORY_ = None
+DOWN = (
+    'Sorry, {} is not responding right now and I have no earlier data to '
+    'answer with. Please try again later!')
+STALE = (
+    '\n\n*The source is not responding right now, so this is the data I '
+    'had as of {} UTC.*')
+NO_HISTORY = (
+    'I have no history for {} yet. I keep one from the first time someone '
+    'asks for their summary, so please try again later!')
 
 
 def setup_logging():
@@ -29,16 +95,17 @@ def setup_logging():
         backupCount=7)
     fh.setLevel(logging.INFO)
     fh.setFormatter(formatter)
+    logger.setLevel(logging.DEBUG)
     logger.addHandler(fh)
     logger.debug('Logger initialized')
 
 
-def bot_help(contents):
+async def bot_help(request, session):
     return """Hi there! Thank you for choosing to use this bot.
 
 # Valid Platform Names
 
-* ps
+* ps (or ps4)
 * xbox
 
 # Valid Commands
@@ -46,23 +113,41 @@ def bot_help(contents):
 (Note: Replace PLAT with a platform from above)
 
 * help
-* player PLAT {{summary, recent, efficiency}} NAME
+* player PLAT {{summary, stats, ratings, recent, efficiency, progress}} NAME
 * player PLAT tanks {{efficiency, top}} NAME
-* clan PLAT {{summary, active, battles, players, tier, top}} NAME
+* player PLAT tanks top [N] [by FIELD] NAME
+* player PLAT progress [DAYS] NAME
+* clan PLAT {{summary, active, battles, players, tiers, top, growth}} NAME
+* clan PLAT top [N] [by FIELD] NAME
+* clan PLAT growth [DAYS] NAME
 * tank PLAT {{moe, wn8}} TANK
 
+Tanks can be sorted by battles, damage, efficiency, tier, wins or wn8. Clan
+members can be sorted by battles, month (this month's WN8), tier or wn8.
+
+Player summaries and stats and clan summaries accept several comma-separated
+names, which are compared in a single table. Player progress (since a week ago
+by default) and clan growth (over the last 30 days by default) are answered
+from the stats I have recorded for earlier requests.
+Player ratings are worked out from the player's stats in every tank, overall
+and for each tier.
+
 # Example Usage
 
 `/u/{0} clan summary RDDT`
 
 `/u/{0} player xbox summary DEZERTstorm03`
 
+`/u/{0} clan ps top 10 by battles RDDT`
+
+`/u/{0} clan ps summary RDDT,ABC,XYZ`
+
 # Looking for community activity?
 
 To reduce server load, a summary of community statistics is posted on Twitter
 under the  [WOTC_Tracker account](https://twitter.com/WOTC_Tracker).
 Information is shared daily. Please like, share, and retweet as much (or as
-little) as you want!""".format(contents[0].split('/')[-1])
+little) as you want!""".format(request.bot)
 
 
 def grouper(n, iterable, fillvalue=None):
@@ -77,427 +162,521 @@ def grouper(n, iterable, fillvalue=None):
     return zip_longest(fillvalue=fillvalue, *args)
 
 
-def player_info(contents):
-    PLAYER_VALID = {
-        'summary': (
-            '##Name: {0[Name]}\n\n'
-            '|Stat|Career Average|\n'
-            ':--|:--\n'
-            'Eff|{0[Eff]}\n'
-            'WN7|{0[WN7]}\n'
-            'WN8|{0[WN8]}\n\n'
-        ),
-        'recent': (
-            '##Name: {0[Name]}\n\n'
-            '|Stat|Week|Month|Overall|\n'
-            ':--|:--|:--|:--\n'
-        ),
-        'efficiency': (
-            '##Name: {0[Name]}\n\n'
-            '|From|To|Efficiency|WN7|WN8|Battles|Wins|\n'
-            ':--|:--|:--|:--|:--|:--|:--\n'
+def day(timestamp, format='%Y-%m-%d'):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(format)
+
+
+def remember(kind, platform, name, stats, response):
+    r"""
+    Add a snapshot of freshly fetched stats to the history, if one is kept
+
+    :param str kind: ``player`` or ``clan``
+    :param str platform: Platform name
+    :param str name: Player or clan name
+    :param dict stats: Stat name to value
+    :param response: Response the stats came from
+    """
+    # Stale data served while the upstream is down is not news
+    if _HISTORY_ is not None and not getattr(response, 'stale', False):
+        _HISTORY_.record(
+            kind, platform, name, stats, getattr(response, 'fetched', None))
+
+
+async def player_id(request, session):
+    r"""
+    Find a player's wotinfo ID, without any network access if we know it
+
+    :param request: :class:`dispatch.Request` naming the player
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :return: Tuple of the player ID and a reply explaining why it could not
+             be found (``None`` when it was)
+    """
+    platform = request.platform.wotinfo
+    playerid = known_player_id(session, platform, request.name)
+    if playerid is not None:
+        return playerid, None
+    r, soup, playerid = await player_page(session, platform, request.name)
+    if r.status_code != 200:
+        return None, (
+            'I received an error code of {} from the server. Please try '
+            'again later!'
+        ).format(r.status_code)
+    if playerid is None:
+        return None, (
+            'Sorry, it looks like you either have an invalid player '
+            'name or the wrong platform in your request. Please '
+            'review your query and try again. If you are still having '
+            'issues, please contact my author for assistance!'
         )
-    }
-    PLAYER_TANK_VALID = {
-        'efficiency': (
-            '##Name: {0[Name]}\n\n'
-            '|Tier|Mastery|Name|Type|Win rate|Wins|Battles|Avg Dmg|'
-            'Percent of all battles|Efficiency|WN8|\n'
-            ':--|:--|:--|:--|:--|:--|:--|:--|:--|:--|:--\n'
-        ),
-        'top': (
-            '##Name: {0[Name]}\n\n'
-            '*Note: These tanks are sorted by WN8 and Total battles. This '
-            'sorting is arbitrary and may not accurately reflect the '
-            'overall performance of the player*\n\n'
-            '|Tier|Mastery|Name|Type|Win rate|Wins|Battles|Avg Dmg|'
-            'Percent of all battles|Efficiency|WN8|\n'
-            ':--|:--|:--|:--|:--|:--|:--|:--|:--|:--|:--\n'
+    return playerid, None
+
+
+def down(error):
+    r"""
+    Reply for a lookup whose upstream could not be reached
+
+    :param IOError error: Why the request failed. Hosts known to be down
+                          (:class:`transport.UpstreamDown`) are named.
+    """
+    return DOWN.format(getattr(error, 'host', None) or 'the data source')
+
+
+async def gather(function, request, session):
+    r"""
+    Run a lookup for every name of a batch request at the same time
+
+    :param function: Coroutine function called with a single-name
+                     :class:`dispatch.Request` and the session
+    :param request: :class:`dispatch.Request` holding several names
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :return: List of the results, in the order of the names. A name whose
+             lookup failed to reach its upstream gets a result with no
+             stats, so the other names are still answered.
+    """
+    function = METRICS.wrap(function)
+
+    async def lookup(single):
+        try:
+            return await function(single, session)
+        except IOError as e:
+            logging.getLogger('Bot').warning(
+                'Lookup of {} failed: {}'.format(single.name, e))
+            return single.name, None, None, down(e)
+
+    singles = [
+        request._replace(name=name, names=(name,)) for name in request.names]
+    with METRICS.timer('batch'):
+        return await asyncio.gather(*(lookup(single) for single in singles))
+
+
+def compare(title, stat, rows, results):
+    r"""
+    Render the stats of several players or clans side by side
+
+    :param str title: Heading of the reply
+    :param str stat: Title of the first column
+    :param rows: Pairs of row title and the compiled template of its cells
+    :param results: Tuples of name, stats (``None`` if the lookup failed),
+                    source URL and error reply
+    :return: :class:`render.MarkdownWriter` holding the reply
+    """
+    out = MarkdownWriter().write(title)
+    out.write('|{}|{}|\n'.format(
+        stat, '|'.join(name for name, _, _, _ in results)))
+    out.write(':--' + '|:--' * len(results))
+    for heading, cell in rows:
+        out.write('\n{}|{}'.format(heading, '|'.join(
+            'n/a' if stats is None else cell(stats)
+            for _, stats, _, _ in results)))
+    failed = [name for name, stats, _, _ in results if stats is None]
+    if failed:
+        out.write('\n\n*No data could be found for: {}*'.format(
+            ', '.join(failed)))
+    out.write('\n\nSources:\n')
+    sources = []
+    for _, stats, url, _ in results:
+        if stats is not None and url not in sources:
+            sources.append(url)
+            out.write('\n* {}'.format(url))
+    return out
+
+
+async def player_stats(request, session):
+    r"""
+    Look up a player's career averages
+
+    :param request: :class:`dispatch.Request` naming the player
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :return: Tuple of the name, the stats (``None`` on failure), the source
+             URL and a reply explaining any failure
+    """
+    player = {'Name': request.name}
+    r, soup, _ = await player_page(
+        session, request.platform.wotinfo, request.name)
+    if r.status_code != 200:
+        return request.name, None, r.url, (
+            'I received an error code of {} from the server. Please try '
+            'again later!'
+        ).format(r.status_code)
+    var = soup.find_all('var')
+    if len(var) != 6:
+        return request.name, None, r.url, (
+            'I did not receive an expected response, which means '
+            'you may have entered the wrong player name or '
+            'platform by accident. Please review your request and '
+            'try again!'
         )
+    for name, value in grouper(2, var):
+        player[name.text.strip()] = value.text.strip()
+    remember('player', request.platform.wotinfo, request.name, {
+        name: value for name, value in player.items() if name != 'Name'}, r)
+    return request.name, player, r.url, None
+
+
+def account_stats(account):
+    r"""
+    Work out a player's career averages from their Wargaming account
+
+    :param dict account: Account details from ``account/info``
+    :return: Dictionary of averages, or ``None`` if the player has no battles
+    """
+    totals = (account.get('statistics') or {}).get('all') or {}
+    battles = totals.get('battles')
+    if not battles:
+        return None
+    return {
+        'Battles': battles,
+        'WinRate': totals['wins'] / battles,
+        'Damage': totals['damage_dealt'] / battles,
+        'Frags': totals['frags'] / battles,
+        'Spots': totals['spotted'] / battles,
     }
-    if contents[2] not in ('ps4', 'xbox'):
-        return 'Bad platform. Please use "ps4" or "xbox" and try again!'
-    if contents[3] == 'tanks' and len(contents) < 5:
-        return 'Something is wrong with your request. Please retry!'
-    elif contents[3] == 'tanks' and contents[4] not in PLAYER_TANK_VALID:
-        return 'Bad subcommand request "{}". Please retry!'.format(contents[4])
-    elif len(contents) < 4:
-        return 'Something is wrong with your request. Please retry!'
-    elif contents[3] != 'tanks' and contents[3] not in PLAYER_VALID:
-        return 'Bad subcommand request "{}". Please retry!'.format(contents[3])
-    offset = 5 if contents[3] == 'tanks' else 4
-    r = get(
-        'http://www.wotinfo.net/en/efficiency',
+
+
+async def player_accounts(request, session):
+    # BOT player PLAT stats NAME[,NAME...], from the Wargaming API. Every
+    # name is resolved in one request and every account fetched in another.
+    platform = request.platform.name
+    try:
+        ids = await _WARGAMING_.account_ids(session, platform, request.names)
+        accounts = await _WARGAMING_.accounts(
+            session, platform, ids.values(), fields='statistics.all')
+    except WargamingError as e:
+        return '{}. Please try again later!'.format(e)
+    url = _WARGAMING_.urls[platform] + 'account/info/'
+    results = []
+    for name in request.names:
+        account = accounts.get(ids.get(name))
+        stats = None if account is None else account_stats(account)
+        results.append((name, stats, url, None))
+    return compare('##Career statistics\n\n', 'Stat', PLAYER_ACCOUNT, results)
+
+
+async def player_ratings(request, session):
+    # BOT player PLAT ratings NAME. Rated locally from the player's stats in
+    # every tank and the catalog's expected values, overall and per tier.
+    platform = request.platform
+    catalog = await _CATALOGS_.get(session, platform.wotclans)
+    if not catalog:
+        return (
+            'I could not load the expected values of the tanks. Please try '
+            'again later!')
+    try:
+        ids = await _WARGAMING_.account_ids(
+            session, platform.name, [request.name])
+        tanks = None
+        if request.name in ids:
+            tanks = await _WARGAMING_.tank_stats(
+                session, platform.name, ids[request.name])
+    except WargamingError as e:
+        return '{}. Please try again later!'.format(e)
+    if not tanks:
+        return 'I could not find any tank statistics for {}.'.format(
+            request.name)
+    ratings = catalog.expected().rate(tanks)
+    if not ratings:
+        return (
+            'None of the tanks {} has played have expected values '
+            'yet.'.format(request.name))
+    out = MarkdownWriter().write(
+        PLAYER_RATINGS(request.name, len(ratings), len(tanks)))
+    out.rows(RATING_ROW, ratings.by_tier() + [('All', ratings.ratings())])
+    return out.write('\n\nSources:\n\n* {}tanks/stats/\n* {}\n'.format(
+        _WARGAMING_.urls[platform.name],
+        TANK_URLS[platform.wotclans].format('wn8')))
+
+
+async def player_summary(request, session):
+    _, player, url, error = await player_stats(request, session)
+    if error is not None:
+        return error
+    return PLAYER_SUMMARY(player) + '\nSource: {}'.format(url)
+
+
+async def player_summaries(request, session):
+    return compare(
+        '##Career averages\n\n', 'Stat', PLAYER_COMPARE,
+        await gather(player_stats, request, session))
+
+
+async def player_progress(request, session):
+    # Answered from the history alone, without any upstream request
+    platform = request.platform.wotinfo
+    now = {} if _HISTORY_ is None else _HISTORY_.state(
+        'player', platform, request.name)
+    if not now:
+        return NO_HISTORY.format(request.name)
+    since = time() - request.count * 86400
+    then = _HISTORY_.state('player', platform, request.name, since)
+    if not then:
+        since = _HISTORY_.first('player', platform, request.name)
+        then = _HISTORY_.state('player', platform, request.name, since)
+    out = MarkdownWriter().write(PLAYER_PROGRESS(request.name, day(since)))
+    out.rows(PROGRESS_ROW, (
+        (stat, then.get(stat, 'n/a'), value) for stat, value in now.items()))
+    return out.write('\n\n')
+
+
+async def player_recent(request, session):
+    playerid, error = await player_id(request, session)
+    if error is not None:
+        return error
+    recent = await session.get(
+        RECENT_URL,
         params={
-            'server': contents[2],
-            'playername': ' '.join(
-                contents[offset:])
-        })
-    if r.status_code != 200:
+            'playerid': playerid,
+            'server': request.platform.wotinfo},
+        key=cache_key('recent', request.platform.wotinfo, request.name))
+    if recent.status_code != 200:
         return (
-            'I received an error code of {} from the server. Please try again '
-            'later!'
+            'I was able to find this user on wotinfo but I '
+            'experienced an error accessing their recent statistics. '
+            'Tagging /u/KamikazeRusher to review this when he gets '
+            'the mention notification.'
         )
-    if contents[3] == 'tanks':
-        player = {'Name': ' '.join(contents[offset:])}
-        soup = BeautifulSoup(r.content, 'html.parser')
-        href = soup.find('li', class_='activemenu').a['href']
-        try:
-            playerid = parse_qs(urlsplit(href).query)['playerid'][0]
-        except KeyError:
-            return (
-                'Sorry, it looks like you either have an invalid player '
-                'name or the wrong platform in your request. Please '
-                'review your query and try again. If you are still having '
-                'issues, please contact my author for assistance!'
-            )
-        vehicles = get(
-            'http://wotinfo.net/en/vehicles',
-            params={
-                'playerid': playerid,
-                'server': contents[2]})
-        if vehicles.status_code != 200:
-            return (
-                'I was able to find this user on wotinfo but I '
-                'experienced an error accessing their vehicle statistics. '
-                'Tagging /u/KamikazeRusher to review this when he gets '
-                'the mention notification.'
-            )
-        # vehicles_soup = BeautifulSoup(vehicles.content, 'html.parser')
-        # source = vehicles_soup.find(
-        #     'script',
-        #     src='https://www.google.com/jsapi'
-        # ).next_sibling.next_sibling
-        ranks = {
-            'rank_01.png': '1',
-            'rank_02.png': '2',
-            'rank_03.png': '3',
-            'rank_m.png': 'M',
-            'FFFFFF-0.png': ''
-        }
-        # Extract all Google Visualization rows that get added
-        rows = []
-        for row in findall(
-                r'data\.addRow\([^\;]+;', vehicles.content.decode('utf8')):
-            # We're cheating here by taking the data entered into the rows and
-            # forcing it into a JSON format for easy parsing.
-            data = []
-            r = loads('{ "data": ' + row[12:-2].replace(
-                # Replace the double-quotes with a character not used
-                '"', '!').replace(
-                # Change the single-quotes to double-quotes
-                "'", '"').replace(
-                # Change the original double-quotes to single-quotes
-                '!', "'").replace(
-                # Surround parameters with quotes for JSON validity
-                'v:', '"v":').replace(
-                'f:', '"f":') + '}')['data']
-            # Tier
-            data.append(r[0])
-            # Mastery
-            data.append(ranks[r[1].split("'")[1].split('/')[-1]])
-            # Name
-            data.append(r[3].split('>')[1][:-3])
-            # Type
-            data.append(r[5].split("'")[-2].split('/')[-1].split('.')[0])
-            # Win rate
-            data.append(r[6]['f'])
-            # Wins
-            data.append(r[7])
-            # Battles
-            data.append(r[8])
-            # Average damage
-            data.append(r[9])
-            # % of all battles
-            data.append(r[10]['f'])
-            # Efficiency
-            data.append(r[11]['v'])
-            # WN8
-            data.append(r[12]['v'])
-            rows.append(data)
-        if contents[4] == 'efficiency':
-            return PLAYER_TANK_VALID[
-                contents[offset - 1]
-            ].format(player) + '\n'.join(
-                map(
-                    lambda r: '{}|{}|{}|{}|{}|{}|{}|{}|{}|{}|{}'.format(*r),
-                    rows)
-            ) + '\n\nSource: {}\n'.format(vehicles.url)
-        elif contents[4] == 'top':
-            sorted_rows = sorted(rows, key=itemgetter(6, 10), reverse=True)
-            return PLAYER_TANK_VALID[
-                contents[offset - 1]
-            ].format(player) + '\n'.join(
-                map(
-                    lambda r: '{}|{}|{}|{}|{}|{}|{}|{}|{}|{}|{}'.format(*r),
-                    sorted_rows[:10])
-            ) + '\n\nSource: {}\n'.format(vehicles.url)
-    else:
-        player = {'Name': ' '.join(contents[offset:])}
-        soup = BeautifulSoup(r.content, 'html.parser')
-        if contents[3] == 'summary':
-            var = soup.find_all('var')
-            if len(var) != 6:
-                return (
-                    'I did not receive an expected response, which means '
-                    'you may have entered the wrong player name or '
-                    'platform by accident. Please review your request and '
-                    'try again!'
-                )
-            else:
-                for name, value in grouper(2, var):
-                    player[name.text.strip()] = value.text.strip()
-                return PLAYER_VALID[
-                    contents[offset - 1]
-                ].format(player) + '\nSource: {}'.format(r.url)
-        elif contents[3] == 'recent':
-            href = soup.find('li', class_='activemenu').a['href']
-            try:
-                playerid = parse_qs(urlsplit(href).query)['playerid'][0]
-            except KeyError:
-                return (
-                    'Sorry, it looks like you either have an invalid player '
-                    'name or the wrong platform in your request. Please '
-                    'review your query and try again. If you are still having '
-                    'issues, please contact my author for assistance!'
-                )
-            recent = get(
-                'http://wotinfo.net/en/recent',
-                params={
-                    'playerid': playerid,
-                    'server': contents[2]})
-            if r.status_code != 200:
-                return (
-                    'I was able to find this user on wotinfo but I '
-                    'experienced an error accessing their recent statistics. '
-                    'Tagging /u/KamikazeRusher to review this when he gets '
-                    'the mention notification.'
-                )
-            recent_soup = BeautifulSoup(recent.content, 'html.parser')
-            # table = recent_soup.find('div', class_='container col-sm-12')
-            stats = {'week': [], 'month': [], 'overall': []}
-            week_and_month = recent_soup.find_all(
-                'div', class_='col-xs-4 col-sm-4 my_plan1')
-            overall = recent_soup.find_all(
-                'div', class_='col-xs-4 col-sm-4 my_plan2')
-            titles = recent_soup.find_all(
-                'div', class_='col-xs-12 col-sm-3 my_feature')
-            stats['titles'] = [[i.strip() for i in s.strings][0]
-                               for s in titles]
-            i = 0
-            # for period, title in zip_longest(week_and_month, titles):
-            for period in week_and_month:
-                if i % 2 == 0:
-                    stats['week'].append(period.text.split()[0])
-                else:
-                    stats['month'].append(period.text.split()[0])
-                i += 1
-            # for period, title in zip(overall, titles):
-            for period in overall:
-                stats['overall'].append(period.text.split()[0])
-            return PLAYER_VALID[
-                contents[offset - 1]
-            ].format(player) + '\n'.join(
-                map(
-                    lambda z: '{}|{}|{}|{}'.format(*z),
-                    zip(
-                        stats['titles'],
-                        stats['week'],
-                        stats['month'],
-                        stats['overall']))
-            ) + '\n\nSource: {}\n'.format(recent.url)
-        elif contents[3] == 'efficiency':
-            href = soup.find('li', class_='activemenu').a['href']
-            try:
-                playerid = parse_qs(urlsplit(href).query)['playerid'][0]
-            except KeyError:
-                return (
-                    'Sorry, it looks like you either have an invalid player '
-                    'name or the wrong platform in your request. Please '
-                    'review your query and try again. If you are still having '
-                    'issues, please contact my author for assistance!'
-                )
-            trend = get(
-                'http://wotinfo.net/en/trend',
-                params={
-                    'playerid': playerid,
-                    'server': contents[2]})
-            if trend.status_code != 200:
-                return (
-                    'I was able to find this user on wotinfo but I '
-                    'experienced an error accessing their efficiency trend. '
-                    'Tagging /u/KamikazeRusher to review this when he gets '
-                    'the mention notification.'
-                )
-            trend_soup = BeautifulSoup(trend.content, 'html.parser')
-            # data_parent = trend_soup.find('ul', class_='thumbnails')
-            # data = data_parent.find_all('div', class_='row')
-            data = trend_soup.find_all('ul', class_='event-list')
-            all_data = []
-            for point in data:
-                l = []
-                # times = point.li('time')
-                # l.append(' '.join(times[0].text.split()[1:]))
-                # l.append(' '.join(times[1].text.split()[1:]))
-                for time in point.li('time'):
-                    l.append(' '.join(time.text.split()[1:]))
-                for div in point.find_all('div', class_='progress'):
-                    l.append(div.text.strip())
-                i = 0
-                for li in point.li.div.ul.find_all('li'):
-                    if i < 2:
-                        l.append(li.text.split()[0])
-                    i += 1
-                all_data.append(l)
-            return PLAYER_VALID[contents[
-                offset - 1]
-            ].format(player) + '\n'.join(
-                map(lambda l: '{}|{}|{}|{}|{}|{}|{}'.format(*l), all_data)
-            ) + '\n\nSource: {}\n'.format(trend.url)
-
-
-def clan_info(contents):
-    CLAN_VALID = {
-        'summary': (
-            '##Name: {0[Name]}\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'This month\'s battles|{0[MonthBattles]}\n'
-            'Total members|{0[Count]}\n'
-            'Active members|{0[Active]}\n'
-            'Percent of players active|{0[ActivePercent]:.3%}\n'
-            'Total WN8|{0[TotalWn8]}\n'
-            'Total win rate|{0[TotalWinRate]:.3%}\n\n'
-        ),
-        'active': (
-            '##Name: {0[Name]}\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'Active member count|{0[Active]}\n'
-            'Percent of players active|{0[ActivePercent]:.3%}\n'
-            'This month\'s battles|{0[MonthBattles]}\n'
-            'Win rate|{0[ActiveWinRate]:.3%}\n'
-            'WN8|{0[ActiveWn8]}\n'
-            'Average tier|{0[ActiveAvgTier]}\n\n'
-            '###Active players\n\n'
-            '{1}\n\n'
-        ),
-        'battles': (
-            '##Name: {0[Name]}\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'Total battles|{0[TotalBattles]}\n'
-            'Total win rate|{0[TotalWinRate]:.3%}\n'
-            'This month\'s battles|{0[MonthBattles]}\n'
-            'This month\'s win rate|{0[MonthWinRate]}\n'
-            'Active player battles|{0[ActiveBattles]}\n'
-            'Top 15 player battles|{0[Top15Battles]}\n\n'
-        ),
-        'players': (
-            '##Name: {0[Name]}\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'Total members|{0[Count]}\n'
-            'Active members|{0[Active]}\n\n'
-            '###All clan members\n\n'
-            '{1}\n\n'
-        ),
-        'tiers': (
-            '##Name: {0[Name]}\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'Total average tier|{0[TotalAvgTier]}\n'
-            'Active average tier|{0[ActiveAvgTier]}\n'
-            'Top 15 average tier|{0[Top15AvgTier]}\n\n'
-            '{1}\n\n'
-        ),
-        'top': (
-            '##Name: {0[Name]}\n\n'
-            '{1}\n\n'
+    recent_soup = parse_page(recent.content, RECENT_PARTS)
+    # table = recent_soup.find('div', class_='container col-sm-12')
+    stats = {'week': [], 'month': [], 'overall': []}
+    week_and_month = recent_soup.find_all(
+        'div', class_='col-xs-4 col-sm-4 my_plan1')
+    overall = recent_soup.find_all(
+        'div', class_='col-xs-4 col-sm-4 my_plan2')
+    titles = recent_soup.find_all(
+        'div', class_='col-xs-12 col-sm-3 my_feature')
+    stats['titles'] = [[i.strip() for i in s.strings][0] for s in titles]
+    i = 0
+    # for period, title in zip_longest(week_and_month, titles):
+    for period in week_and_month:
+        if i % 2 == 0:
+            stats['week'].append(period.text.split()[0])
+        else:
+            stats['month'].append(period.text.split()[0])
+        i += 1
+    # for period, title in zip(overall, titles):
+    for period in overall:
+        stats['overall'].append(period.text.split()[0])
+    out = MarkdownWriter().write(PLAYER_RECENT({'Name': request.name}))
+    out.rows(RECENT_ROW, zip(
+        stats['titles'], stats['week'], stats['month'], stats['overall']))
+    return out.write('\n\nSource: {}\n'.format(recent.url))
+
+
+async def player_efficiency(request, session):
+    playerid, error = await player_id(request, session)
+    if error is not None:
+        return error
+    trend = await session.get(
+        TREND_URL,
+        params={
+            'playerid': playerid,
+            'server': request.platform.wotinfo},
+        key=cache_key('trend', request.platform.wotinfo, request.name))
+    if trend.status_code != 200:
+        return (
+            'I was able to find this user on wotinfo but I '
+            'experienced an error accessing their efficiency trend. '
+            'Tagging /u/KamikazeRusher to review this when he gets '
+            'the mention notification.'
         )
-    }
-    if contents[2] not in ('ps', 'xbox'):
-        return 'Bad platform. Please use "ps" or "xbox"'
-    if contents[2] == 'ps':
-        url = 'https://ps.wotclans.com.br/api/clan/'
-    else:
-        url = 'https://wotclans.com.br/api/clan/'
-    if len(contents) < 5:
-        return 'No clan name entered. Please retry!'
-    if contents[3] in CLAN_VALID:
-        r = get(url + contents[4])
-        if r.status_code == 200:
-            try:
-                data = r.json()
-                players = []
-                if contents[3] == 'active':
-                    players = [
-                        '{0[Name]} | {0[MonthBattles]}'.format(
-                            p) for p in list(
-                            filter(
-                                lambda p: p['MonthBattles'],
-                                data['Players']))]
-                    players.insert(0, 'Player | Months\'s battles')
-                    players.insert(1, ':-:|:-:')
-                elif contents[3] == 'players':
-                    players = [
-                        '{0[Name]} | {0[TotalWn8]} | {0[MonthWn8]}'.format(
-                            p) for p in data['Players']]
-                    players.insert(
-                        0, 'Player | Total WN8 | Month\'s WN8')
-                    players.insert(1, ':-:|:-:|:-:')
-                elif contents[3] == 'tiers':
-                    players = [
-                        '{0[Name]} | {0[TotalTier]} | {0[MonthTier]}'.format(
-                            p) for p in data['Players']]
-                    players.insert(
-                        0,
-                        (
-                            'Player | Lifetime tier average | '
-                            'Month\'s tier average'
-                        ))
-                    players.insert(1, ':-:|:-:|:-:')
-                elif contents[3] == 'top':
-                    top_all = sorted(
-                        data['Players'],
-                        key=lambda p: p['TotalWn8'],
-                        reverse=True)[0:7]
-                    top_rec = sorted(
-                        data['Players'],
-                        key=lambda p: p['MonthWn8'],
-                        reverse=True)[0:7]
-                    players = [
-                        '{0[Name]} | {0[MonthWn8]}'.format(p) for p in top_rec]
-                    players.insert(0, '###Top 7 active players\n')
-                    players.insert(1, 'Player | Month\'s WN8')
-                    players.insert(2, ':-:|:-:')
-                    players += ['\n', '###Top 7 players overall\n',
-                                'Player | Lifetime WN8', ':-:|:-:']
-                    players += ['{0[Name]} | {0[TotalWn8]}'.format(p)
-                                for p in top_all]
-                return (
-                    CLAN_VALID[contents[3]].format(data, '\n'.join(players)) +
-                    'Source: {}'.format(r.url)
-                )
-            except JSONDecodeError:
-                return """Data returned by the website is not in a valid JSON
-format. You may manually check this at https://wotclans.com.br/Clan/{}, but I'm
-afraid that I cannot properly respond to your request at this time. Sorry!
+    trend_soup = parse_page(trend.content, TREND_PARTS)
+    # data_parent = trend_soup.find('ul', class_='thumbnails')
+    # data = data_parent.find_all('div', class_='row')
+    data = trend_soup.find_all('ul', class_='event-list')
+    all_data = []
+    for point in data:
+        l = []
+        # times = point.li('time')
+        # l.append(' '.join(times[0].text.split()[1:]))
+        # l.append(' '.join(times[1].text.split()[1:]))
+        for stamp in point.li('time'):
+            l.append(' '.join(stamp.text.split()[1:]))
+        for div in point.find_all('div', class_='progress'):
+            l.append(div.text.strip())
+        i = 0
+        for li in point.li.div.ul.find_all('li'):
+            if i < 2:
+                l.append(li.text.split()[0])
+            i += 1
+        all_data.append(l)
+    out = MarkdownWriter().write(PLAYER_EFFICIENCY({'Name': request.name}))
+    out.rows(TREND_ROW, all_data)
+    return out.write('\n\nSource: {}\n'.format(trend.url))
+
 
-¯\\\\\\_(ツ)\\_/¯""".format(contents[4])
+async def player_tanks(request, session):
+    playerid, error = await player_id(request, session)
+    if error is not None:
+        return error
+    vehicles = await session.get(
+        VEHICLES_URL,
+        params={
+            'playerid': playerid,
+            'server': request.platform.wotinfo},
+        key=cache_key('vehicles', request.platform.wotinfo, request.name))
+    if vehicles.status_code != 200:
+        return (
+            'I was able to find this user on wotinfo but I '
+            'experienced an error accessing their vehicle statistics. '
+            'Tagging /u/KamikazeRusher to review this when he gets '
+            'the mention notification.'
+        )
+    # Extract all Google Visualization rows that get added
+    with METRICS.timer('decode'):
+        rows = gviz.vehicles(vehicles.content.decode('utf8'))
+    player = {'Name': request.name}
+    if request.subcommand == 'tanks top':
+        if request.field is None:
+            player['Sort'] = (
+                'These tanks are sorted by WN8 and Total battles. This '
+                'sorting is arbitrary and may not accurately reflect the '
+                'overall performance of the player')
+            key = attrgetter('battles', 'wn8')
         else:
-            return """There appears to be an error at
+            player['Sort'] = 'These tanks are sorted by {}'.format(
+                request.field)
+            key = TANK_FIELDS[request.field]
+        rows = top(rows, request.count, key)
+    out = MarkdownWriter().write(PLAYER_TANKS[request.subcommand](player))
+    out.rows(TANK_ROW, rows)
+    return out.write('\n\nSource: {}\n'.format(vehicles.url))
+
+
+def clan_active(out, roster, request):
+    out.rows(CLAN_ACTIVE_ROW, roster.records(roster.active()), lead=True)
+
+
+def clan_players(out, roster, request):
+    out.rows(CLAN_PLAYERS_ROW, roster.records(), lead=True)
+
+
+def clan_tiers(out, roster, request):
+    out.rows(CLAN_TIERS_ROW, roster.records(), lead=True)
+
+
+def clan_top(out, roster, request):
+    count = request.count
+    if request.field is not None:
+        column, title, row = CLAN_FIELDS[request.field]
+        out.write(CLAN_TOP_FIELD(count, request.field, title))
+        out.rows(row, roster.records(roster.top(column, count)), lead=True)
+        return
+    ranked = rankings(range(len(roster)), count, {
+        'month': roster.columns['MonthWn8'].__getitem__,
+        'total': roster.columns['TotalWn8'].__getitem__})
+    out.write(CLAN_TOP_MONTH(count))
+    out.rows(CLAN_MONTH_ROW, roster.records(ranked['month']), lead=True)
+    out.write(CLAN_TOP_TOTAL(count))
+    out.rows(CLAN_TOTAL_ROW, roster.records(ranked['total']), lead=True)
+
+
+async def clan_data(request, session):
+    r"""
+    Look up a clan on wotclans
+
+    :param request: :class:`dispatch.Request` naming the clan
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :return: Tuple of the name, the :class:`roster.Clan` (``None`` on
+             failure), the source URL and a reply explaining any failure
+    """
+    name = request.name
+    platform = request.platform.wotclans
+    r = await session.get(
+        CLAN_URLS[platform] + name, key=cache_key('clan', platform, name))
+    if r.status_code != 200:
+        return name, None, r.url, """There appears to be an error at
 https://wotclans.com.br/api/clan/{}. If your clan is not yet added to the site
 database, please follow instructions at https://wotclans.com.br/About#addClan
-to have it added. Sorry!""".format(
-                contents[4])
-    else:
-        return (
-            'Invalid clan command. Please try one of the following: {}'
-        ).format(', '.join(CLAN_VALID.keys()))
+to have it added. Sorry!""".format(name)
+    key = cache_key('roster', platform, name)
+    fetched = getattr(r, 'fetched', None)
+    if session.cache is not None and fetched is not None:
+        clan = session.cache.get(key)
+        if clan is not None and clan.fetched == fetched:
+            return name, clan, r.url, None
+    try:
+        with METRICS.timer('decode'):
+            clan = Clan(r.json(), fetched)
+    except JSONDecodeError:
+        error = """Data returned by the website is not in a valid JSON
+format. You may manually check this at https://wotclans.com.br/Clan/{}, but I'm
+afraid that I cannot properly respond to your request at this time. Sorry!
+
+¯\\\\\\_(ツ)\\_/¯""".format(name)
+        return name, None, r.url, error
+    if session.cache is not None and fetched is not None:
+        session.cache.set(key, clan)
+    remember('clan', platform, name, {
+        stat: value for stat, value in clan.info.items()
+        if type(value) in (int, float)}, r)
+    return name, clan, r.url, None
+
+
+def clan_stats(clan):
+    r"""
+    The clan's listing, with the aggregates worked out from its roster
+
+    :param clan: :class:`roster.Clan`
+    :return: Dictionary for the :data:`render.CLAN_HEADS` templates
+    """
+    roster = clan.roster
+    mean = roster.mean('TotalWn8')
+    median = roster.percentile('TotalWn8', 0.5)
+    active = roster.percentile('MonthWn8', 0.5, roster.active())
+    return dict(
+        clan.info,
+        MeanWn8='n/a' if mean is None else round(mean),
+        MedianWn8='n/a' if median is None else median,
+        ActiveMedianWn8='n/a' if active is None else active)
+
+
+async def clan_info(request, session):
+    # Writes the table of players shown by a subcommand
+    TABLES = {
+        'active': clan_active,
+        'players': clan_players,
+        'tiers': clan_tiers,
+        'top': clan_top,
+    }
+    _, clan, url, error = await clan_data(request, session)
+    if error is not None:
+        return error
+    out = MarkdownWriter().write(CLAN_HEADS[request.subcommand](
+        clan_stats(clan)))
+    table = TABLES.get(request.subcommand)
+    if table is not None:
+        table(out, clan.roster, request)
+        out.write('\n\n')
+    return out.write('Source: {}'.format(url))
+
+
+async def clan_growth(request, session):
+    # Answered from the history alone, without any upstream request
+    timeline = [] if _HISTORY_ is None else _HISTORY_.timeline(
+        'clan', request.platform.wotclans, request.name,
+        time() - request.count * 86400)
+    if not timeline:
+        return NO_HISTORY.format(request.name)
+    # The last snapshot of each day
+    daily = {}
+    for taken, stats in timeline:
+        daily[day(taken)] = stats
+    out = MarkdownWriter().write(CLAN_GROWTH(request.name))
+    out.rows(GROWTH_ROW, (
+        (date, stats.get('Count', 'n/a'), stats.get('Active', 'n/a'),
+         stats.get('MonthBattles', 'n/a'), stats.get('TotalWn8', 'n/a'))
+        for date, stats in daily.items()), lead=True)
+    return out.write('\n\n')
 
 
-def thank_you(contents):
+async def clan_summaries(request, session):
+    results = await gather(clan_data, request, session)
+    return compare(
+        '##Clan summaries\n\n', 'Clan', CLAN_COMPARE, [
+            (name, None if clan is None else clan.info, url, error)
+            for name, clan, url, error in results])
+
+
+async def thank_you(request, session):
     return """Thank you! I may not be handsome, but I hope you at least find me
 handy!
 
@@ -506,74 +685,44 @@ Credit for my development goes to
 the author of the cited source(s)."""
 
 
-def tank_info(contents):
-    TANK_VALID = {
-        'moe': (
-            '##Name: {0[Name]}\n\n'
-            '{0[TypeName]} tier {0[Tier]} tank ({0[NatioName]})\n\n'
-            'Mark | Average Damage\n'
-            ':-:|:-:\n'
-            '1|{0[Moe1Dmg]}\n'
-            '2|{0[Moe2Dmg]}\n'
-            '3|{0[Moe3Dmg]}\n\n'
-            'Source: {1}'
-        ),
-        'wn8': (
-            '##Name: {0[Name]}\n\n'
-            '{0[TypeName]} tier {0[Tier]} tank ({0[NatioName]})\n\n'
-            '*Note: These are the Expected Values, which reflect the 65^th '
-            'percentile of players! (Matching these gives a WN8 of 1565)*\n\n'
-            '|||\n'
-            ':--|:--\n'
-            'Damage|{0[Damage]}\n'
-            'Win rate|{0[WinRate]}\n'
-            'Kill ratio|{0[Frag]}\n'
-            'Spot ratio|{0[Spot]}\n'
-            'Defense ratio|{0[Def]}\n\n'
-            'Source: {1}'
-        )
-    }
+async def tank_info(request, session):
     # BOT tank PLAT {moe, wn8} TANK
-    if contents[2] not in ('ps', 'xbox'):
-        return 'Bad platform. Please use "ps" or "xbox"'
-    if contents[2] == 'ps':
-        url = 'https://ps.wotclans.com.br/api/tanks/{}'
+    platform = request.platform.wotclans
+    url = TANK_URLS[platform].format(request.subcommand)
+    name = request.name
+    catalog = await _CATALOGS_.get(session, platform)
+    if catalog:
+        if _CATALOGS_.outdated(platform):
+            # Kept because a fresh one could not be downloaded
+            served_stale(catalog.updated)
+        # Answer from the local catalog and only fall back to the API search
+        # while the catalog cannot be downloaded
+        tanks = catalog.search(name, REQUIRED[request.subcommand])
+        source = '{}?{}'.format(url, urlencode({'tank': name}))
     else:
-        url = 'https://wotclans.com.br/api/tanks/{}'
-    if len(contents) < 5:
-        return 'No tank name entered. Please retry!'
-    if contents[3] in TANK_VALID:
-        r = get(
-            url.format(contents[3]),
-            params={'tank': ' '.join(contents[4:])}
+        r = await session.get(
+            url,
+            params={'tank': name},
+            key=cache_key(request.subcommand, platform, name)
         )
         if r.status_code != 200:
             return (
-                'The API does not appear to accept your tank. Perhaps you '
-                'misspelled?'
-            )
-        tanks = r.json()['Tanks']
-        if len(tanks) < 1:
-            return (
-                'The API does not appear to accept your tank. Perhaps you '
-                'misspelled?'
+                'The API does not appear to accept your tank. Perhaps '
+                'you misspelled?'
             )
-        elif len(tanks) > 1:
-            return (
-                'Multiple tanks were returned for that name. This means there '
-                'is not an exact match. You can retry with one of the '
-                'following (assuming it contains what you want):\n\n'
-                '|Tank|\n'
-                '|:-:|\n{}\n\n'
-            ).format('\n'.join(
-                map(lambda t: '|' + t['Name'] + '|', tanks))
-            )
-        else:
-            return TANK_VALID[contents[3]].format(tanks[0], r.url)
-    else:
+        with METRICS.timer('decode'):
+            tanks = r.json()['Tanks']
+        source = r.url
+    if len(tanks) < 1:
         return (
-            'Invalid tank command. Please try one of the following: {}'
-        ).format(', '.join(TANK_VALID.keys()))
+            'The API does not appear to accept your tank. Perhaps you '
+            'misspelled?'
+        )
+    elif len(tanks) > 1:
+        out = MarkdownWriter().write(TANK_CHOICES)
+        return out.rows(TANK_CHOICE_ROW, tanks, lead=True).write('\n\n')
+    else:
+        return TANK_INFO[request.subcommand](tanks[0], source)
 
 
 # def tank_cost(contents):
@@ -582,74 +731,407 @@ def tank_info(contents):
 #         fields=['name', 'price_credit', 'price_gold'])
 
 
-def parse(message):
-    VALID = {
-        'help': bot_help,
-        'player': player_info,
-        'clan': clan_info,
-        'tank': tank_info,
-        # 'cost': tank_cost
-    }
-    RESPONSES = {
-        'good': thank_you,
-    }
-    contents = message.body.lower().split()
-    if len(contents) == 1:
-        return VALID['help'](contents)
-    if '/' not in contents[0]:
-        if contents[0] in RESPONSES:
-            return RESPONSES[contents[0]](contents)
+COMMANDS = {
+    'help': Command(bot_help),
+    'player': Command(subcommands={
+        'summary': Subcommand(player_summary, batch=player_summaries),
+        'recent': Subcommand(player_recent),
+        'efficiency': Subcommand(player_efficiency),
+        'stats': Subcommand(player_accounts, batch=player_accounts),
+        'ratings': Subcommand(player_ratings),
+        'progress': Subcommand(player_progress, days=7),
+        'tanks efficiency': Subcommand(player_tanks),
+        'tanks top': Subcommand(player_tanks, 10, TANK_FIELDS),
+    }),
+    'clan': Command(
+        subcommands={
+            'summary': Subcommand(clan_info, batch=clan_summaries),
+            'active': Subcommand(clan_info),
+            'battles': Subcommand(clan_info),
+            'players': Subcommand(clan_info),
+            'tiers': Subcommand(clan_info),
+            'top': Subcommand(clan_info, 7, CLAN_FIELDS),
+            'growth': Subcommand(clan_growth, days=30),
+        },
+        missing='No clan name entered. Please retry!',
+        invalid='Invalid clan command. Please try one of the following: {1}',
+        words=1),
+    'tank': Command(
+        subcommands={
+            'moe': Subcommand(tank_info),
+            'wn8': Subcommand(tank_info),
+        },
+        missing='No tank name entered. Please retry!',
+        invalid='Invalid tank command. Please try one of the following: {1}'),
+    # 'cost': Command(tank_cost),
+}
+RESPONSES = {
+    'good': thank_you,
+}
+
+
+async def answer(message, session):
+    r"""
+    Work out the reply to a message
+
+    Call it inside ``METRICS.request()``, which it labels with the command
+    and platform once they are known.
+
+    :param message: Message whose body is parsed
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :return: Reply, as a string or :class:`render.MarkdownWriter`, or
+             ``None`` if the message needs none
+    """
+    with METRICS.timer('parse'):
+        request = resolve(message.body.lower().split(), COMMANDS, RESPONSES)
+    if not isinstance(request, Request):
+        return request
+    # Known names only, so junk mentions cannot create an unbounded number
+    # of metric series
+    METRICS.label(
+        command=request.command,
+        platform=request.platform.name if request.platform else 'none')
+    if request.command == 'clan':
+        for name in request.names:
+            _PREFETCH_.record(request.platform.wotclans, name)
+    served = []
+    token = SERVED_STALE.set(served)
+    try:
+        response = await request.handler(request, session)
+    except IOError as e:
+        # Answered rather than left unread, as the inbox stream would never
+        # offer the mention again. Hosts known to be down fail fast.
+        if not isinstance(e, UpstreamDown):
+            logging.getLogger('Bot').warning(
+                'Request {} failed: {}'.format(message.body, e))
+        return down(e)
+    finally:
+        SERVED_STALE.reset(token)
+    if served and response is not None:
+        note = STALE.format(day(min(served), '%Y-%m-%d %H:%M'))
+        if isinstance(response, MarkdownWriter):
+            response.write(note)
         else:
-            return None
-    elif contents[1] not in VALID:
-        return """Oops! Your first command is not valid. Please review your
-spelling and try again. If you continue to have this issue, please
-check the wiki over at /r/{} or ask a mod there for help.""".format(
-            contents[0].split('/')[-1])
-    else:
-        return VALID[contents[1]](contents)
+            response += note
+    return response
+
+
+def parse(message, session):
+    r"""
+    Answer a message outside of an event loop
 
+    A thin wrapper around :func:`answer` for tests and benchmarks.
 
-def process(message, reddit):
-    response = parse(message)
+    :param message: Message whose body is parsed
+    :param session: :class:`transport.Transport` to fetch with
+    """
+    wrapped = aiotransport.asynchronous(session)
+    try:
+        with METRICS.request(command='other', platform='none'):
+            return asyncio.run(answer(message, wrapped))
+    finally:
+        if wrapped is not session:
+            wrapped.executor.shutdown(wait=False)
+
+
+def paginate(response):
+    r"""
+    Split a reply into comments short enough to be posted
+
+    :param response: Reply, as a string or :class:`render.MarkdownWriter`,
+                     or ``None`` if the message needs none
+    :return: List of pages, or ``None``
+    """
     if response is None:
-        pass
-    elif len(response) <= 10000:
-        message.reply(response)
+        return None
+    if not isinstance(response, MarkdownWriter):
+        response = MarkdownWriter().write(response)
+    return response.pages()
+
+
+async def respond(message, pages, praw, journal=None, posted=0, parent=None):
+    r"""
+    Post a reply as a chain of comments, each answering the one before
+
+    Every page is journaled as soon as it is posted, so a chain that breaks
+    off is resumed after its last posted page instead of started over.
+
+    :param message: Message to reply to
+    :param list pages: Pages of the reply, or ``None`` if it needs none
+    :param praw: Executor running every Reddit call
+    :param journal: Optional :class:`journal.Journal` of answered messages
+    :param int posted: Number of pages already posted
+    :param parent: Comment holding the last page already posted
+    """
+    for index in range(posted, len(pages or ())):
+        with METRICS.timer('reply'):
+            parent = await blocking(
+                praw, (parent or message).reply, pages[index])
+        if journal is not None:
+            journal.posted(message.id, index + 1, parent.id)
+
+
+def triage(message, subreddits):
+    r"""
+    Decide whether a message should be answered
+
+    Messages we will not answer are marked as read here.
+
+    :param message: Inbox item to check
+    :param list subreddits: Lowercase names of subreddits we serve
+    :return: True if the message is a mention from a subreddit we serve
+    """
+    logger = logging.getLogger('Bot')
+    if message.subreddit is None:
+        logger.warning(
+            'Recevied direct message from {0.author}'.format(message))
+        # We don't respond to direct messages
+        message.mark_read()
+    elif message.subreddit.display_name.lower() in subreddits:
+        return True
     else:
-        sub = reddit.subreddit(reddit.config.username)
-        submission = sub.submit(
-            'Response to ' + str(message.author),
-            response,
-            send_replies=False)
-        message.reply((
-            "I'm sorry, it appears my response is greater than the maximum "
-            "allowed comment length. (Max: 10000, Mine: {}). I have created a "
-            "self-post at {}"
-        ).format(len(response), submission.url))
-
-
-def run(bot_name, subreddits):
+        logger.warning(
+            ('Message from {0.author} is from subreddit {0.subreddit} '
+             'which is outside of our scope'
+             ).format(message))
+        # We'll instead ignore any mentions outside of scope
+        message.mark_read()
+    return False
+
+
+async def recall(message, reddit, praw, journal):
+    r"""
+    Finish a message that an earlier run already answered
+
+    The pages of the stored reply that were never posted are posted, so the
+    mention is not looked up again, and the message is marked as read.
+
+    :param message: Inbox item to check
+    :param reddit: ``praw.Reddit`` instance, to find the last posted page
+    :param praw: Executor running every Reddit call
+    :param journal: :class:`journal.Journal`, or ``None``
+    :return: True if the journal held the message
+    """
+    if journal is None:
+        return False
+    entry = journal.get(message.id)
+    if entry is None:
+        return False
+    replied, pages, posted, parent = entry
+    if not replied:
+        logging.getLogger('Bot').info(
+            'Resending stored reply to message {0.id} from page {1}'.format(
+                message, posted + 1))
+        if parent is not None:
+            parent = await blocking(praw, reddit.comment, parent)
+        await respond(message, pages, praw, journal, posted, parent)
+        journal.replied(message.id)
+    await blocking(praw, message.mark_read)
+    return True
+
+
+async def process(message, session, praw, limit, journal=None):
+    r"""
+    Answer a mention, reply to it and mark it as read
+
+    :param message: Inbox item to answer
+    :param session: :class:`aiotransport.AsyncTransport` used by the handlers
+    :param praw: Executor running every Reddit call
+    :param limit: ``asyncio.Semaphore`` bounding the mentions looked up at
+                  once
+    :param journal: Optional :class:`journal.Journal` of answered messages
+    """
+    logger = logging.getLogger('Bot')
+    # The reply is timed with the labels of the request it answers
+    with METRICS.request(command='other', platform='none'):
+        try:
+            with METRICS.timer('queue'):
+                await limit.acquire()
+            try:
+                response = await answer(message, session)
+            finally:
+                limit.release()
+        except Exception:
+            # Leave the message unread so the next run retries it
+            logger.exception(
+                'Failed to process message {0.id}'.format(message))
+            return
+        pages = paginate(response)
+        if journal is not None:
+            journal.rendered(message.id, pages)
+        try:
+            await respond(message, pages, praw, journal)
+            if journal is not None:
+                journal.replied(message.id)
+            await blocking(praw, message.mark_read)
+        except Exception:
+            # e.g. the mention was deleted. The message stays unread and the
+            # journal lets the next run finish it without answering it
+            # again.
+            logger.exception(
+                'Failed to reply to message {0.id}'.format(message))
+            return
+    logger.debug('Completed message {0.id}'.format(message))
+
+
+async def accept(message, reddit, subreddits, session, praw, limit,
+                 journal=None):
+    r"""
+    Start answering a message if it is a new mention we serve
+
+    :param message: Inbox item to check
+    :param reddit: ``praw.Reddit`` instance the message came from
+    :param list subreddits: Lowercase names of subreddits we serve
+    :param session: :class:`aiotransport.AsyncTransport` used by the handlers
+    :param praw: Executor running every Reddit call
+    :param limit: ``asyncio.Semaphore`` bounding the mentions looked up at
+                  once
+    :param journal: Optional :class:`journal.Journal` of answered messages
+    :return: Task answering the message, or ``None`` if there is nothing to
+             answer
+    """
+    try:
+        if not await blocking(praw, triage, message, subreddits) or \
+                await recall(message, reddit, praw, journal):
+            return None
+    except Exception:
+        logging.getLogger('Bot').exception(
+            'Failed to check message {0.id}'.format(message))
+        return None
+    return asyncio.ensure_future(
+        process(message, session, praw, limit, journal))
+
+
+async def drain(reddit, subreddits, session, praw, limit, journal=None):
+    # Every unread message is looked up at once, up to the limit. Only the
+    # Reddit calls are serialized, on the praw executor, as praw is not
+    # thread-safe.
+    messages = await blocking(praw, list, reddit.inbox.unread(limit=None))
+    tasks = []
+    for message in messages:
+        task = await accept(
+            message, reddit, subreddits, session, praw, limit, journal)
+        if task is not None:
+            tasks.append(task)
+    await asyncio.gather(*tasks)
+
+
+async def run(bot_name, subreddits, session, workers=32, journal=None):
+    from praw import Reddit
     setup_logging()
     logger = logging.getLogger('Bot')
     reddit = Reddit(bot_name)
-    for message in reddit.inbox.unread(limit=None):
-        if message.subreddit is None:
-            logger.warning(
-                'Recevied direct message from {0.author}'.format(message))
-            # We don't respond to direct messages
-            message.mark_read()
-        elif message.subreddit.display_name.lower() in subreddits:
-            process(message, reddit)
-            message.mark_read()
-            logger.debug('Completed message {0.id}'.format(message))
-        else:
-            logger.warning(
-                ('Message from {0.author} is from subreddit {0.subreddit} '
-                 'which is outside of our scope'
-                 ).format(message))
-            # We'll instead ignore any mentions outside of scope
-            message.mark_read()
+    with ThreadPoolExecutor(max_workers=1) as praw:
+        await drain(reddit, subreddits, session, praw,
+                    asyncio.Semaphore(workers), journal)
+    if session.cache is not None:
+        logger.info('Cache hits/misses by endpoint: {}'.format(
+            session.cache.stats()))
+    logger.info('Stage timings: {}'.format(METRICS.summary()))
+    await session.close()
+
+
+async def serve(bot_name, subreddits, session, workers=32, poll_interval=5.0,
+                report_interval=3600, journal=None):
+    r"""
+    Answer mentions as they arrive until SIGTERM or SIGINT is received
+
+    :param str bot_name: Site name in praw.ini to log in with
+    :param list subreddits: Lowercase names of subreddits we serve
+    :param session: :class:`aiotransport.AsyncTransport` used by the handlers
+    :param int workers: Number of mentions looked up at once
+    :param float poll_interval: Seconds to wait between empty inbox polls
+    :param float report_interval: Seconds between stage timing summaries in
+                                  the log. No summaries are logged when 0.
+    :param journal: Optional :class:`journal.Journal` of answered messages
+    """
+    from praw import Reddit
+    from prawcore.exceptions import PrawcoreException
+    setup_logging()
+    logger = logging.getLogger('Bot')
+    reddit = Reddit(bot_name)
+    stop = asyncio.Event()
+
+    def shutdown(signum):
+        logger.info('Received signal {}, shutting down'.format(signum))
+        stop.set()
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(SIGTERM, shutdown, SIGTERM)
+    loop.add_signal_handler(SIGINT, shutdown, SIGINT)
+    logger.info('Streaming inbox for /u/{}'.format(reddit.config.username))
+    reported = pruned = monotonic()
+    limit = asyncio.Semaphore(workers)
+    with ThreadPoolExecutor(max_workers=1) as praw:
+        pending = set()
+        stream = None
+        drained = None
+        failures = 0
+        while not stop.is_set():
+            try:
+                if drained is None:
+                    # Catch up on everything left unread, by a previous run
+                    # or by a failed reply, before streaming. The stream only
+                    # returns the newest 100 unread items, and each only once.
+                    await drain(
+                        reddit, subreddits, session, praw, limit, journal)
+                    drained = monotonic()
+                if stream is None:
+                    stream = reddit.inbox.stream(pause_after=0)
+                message = await blocking(praw, next, stream)
+            except PrawcoreException:
+                # Reddit is down or refusing us. Back off, then start a new
+                # stream, as a generator that raised cannot be resumed.
+                failures += 1
+                delay = min(poll_interval * 2 ** failures, 300)
+                logger.exception(
+                    'Inbox stream failed, retrying in {:.0f}s'.format(delay))
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                stream = None
+                continue
+            failures = 0
+            if message is not None:
+                task = await accept(
+                    message, reddit, subreddits, session, praw, limit,
+                    journal)
+                if task is not None:
+                    pending.add(task)
+            elif pending:
+                await asyncio.wait(
+                    pending, timeout=poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED)
+            else:
+                # Use the idle time to refresh what is asked for most
+                _PREFETCH_.schedule(session)
+                if journal is not None and \
+                        monotonic() - pruned >= JOURNAL_PRUNE:
+                    journal.prune()
+                    pruned = monotonic()
+                if monotonic() - drained >= INBOX_REDRAIN:
+                    drained = None
+                try:
+                    await asyncio.wait_for(stop.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            for task in [t for t in pending if t.done()]:
+                pending.discard(task)
+                if task.exception() is not None:
+                    logger.error(
+                        'Message task failed', exc_info=task.exception())
+            if report_interval and \
+                    monotonic() - reported >= report_interval:
+                logger.info('Stage timings: {}'.format(METRICS.summary()))
+                reported = monotonic()
+        await asyncio.gather(*pending)
+    if session.cache is not None:
+        logger.info('Cache hits/misses by endpoint: {}'.format(
+            session.cache.stats()))
+    logger.info('Stage timings: {}'.format(METRICS.summary()))
+    await session.close()
+
 
 if __name__ == '__main__':
     # with open(argv[2]) as f:
@@ -662,13 +1144,49 @@ if __name__ == '__main__':
         '--generate',
         action='store_true',
         help='Generate a configuration file with default values')
+    argparse.add_argument(
+        '-d',
+        '--daemon',
+        action='store_true',
+        help='Keep running and answer mentions as they arrive')
     args = argparse.parse_args()
     config = ConfigParser()
     if args.generate:
         config['DEFAULT'] = {
             'Bot Name': 'wotc_bot',
             'Subreddits': 'worldoftanksconsole,wotc_bot',
-            'WG API': 'demo'
+            'WG API': 'demo',
+            'Workers': '32',
+            'Catalog Refresh': '86400',
+            'Poll Interval': '5',
+            'Pool Connections': '4',
+            'Pool Size': '8',
+            'Timeout': '10',
+            'Connect Timeout': '3',
+            'Retries': '2',
+            'Backoff': '0.5',
+            'Rate Limit': '5',
+            'Rate Burst': '10',
+            'Breaker Failures': '5',
+            'Breaker Cooldown': '60',
+            'Metrics Port': '0',
+            'Metrics Interval': '3600',
+            'Journal File': 'journal.db',
+            'Journal Keep': '2592000',
+            'History File': 'history.db',
+            'Prefetch Clans': '',
+            'Prefetch Size': '10',
+            'Prefetch Interval': '300',
+            'Cache Size': '512',
+            'Cache File': '',
+            'Cache Keep': '86400',
+            'Cache TTL clan': '900',
+            'Cache TTL moe': '86400',
+            'Cache TTL wn8': '86400',
+            'Cache TTL efficiency': '900',
+            'Cache TTL vehicles': '3600',
+            'Cache TTL recent': '600',
+            'Cache TTL trend': '3600'
         }
         with open(args.filename, 'w') as f:
             config.write(f)
@@ -676,7 +1194,38 @@ if __name__ == '__main__':
         config.read(args.filename)
         try:
             _WG_API_KEY_ = config['DEFAULT']['WG API']
-            run(config['DEFAULT']['Bot Name'],
-                config['DEFAULT']['Subreddits'].split(','))
+            _WARGAMING_.application_id = _WG_API_KEY_
+            _CATALOGS_.refresh = config['DEFAULT'].getfloat(
+                'Catalog Refresh', fallback=86400)
+            _PREFETCH_.configure(config['DEFAULT'])
+            session = aiotransport.from_config(
+                config['DEFAULT'],
+                ResponseCache.from_config(config['DEFAULT']))
+            journal = Journal.from_config(config['DEFAULT'])
+            _HISTORY_ = History.from_config(config['DEFAULT'])
+            port = config['DEFAULT'].getint('Metrics Port', fallback=0)
+            if port:
+                serve_metrics(port, cache=session.cache)
+            if args.daemon:
+                asyncio.run(serve(
+                    config['DEFAULT']['Bot Name'],
+                    config['DEFAULT']['Subreddits'].split(','),
+                    session,
+                    config['DEFAULT'].getint('Workers', fallback=32),
+                    config['DEFAULT'].getfloat('Poll Interval', fallback=5.0),
+                    config['DEFAULT'].getfloat(
+                        'Metrics Interval', fallback=3600),
+                    journal))
+            else:
+                asyncio.run(run(
+                    config['DEFAULT']['Bot Name'],
+                    config['DEFAULT']['Subreddits'].split(','),
+                    session,
+                    config['DEFAULT'].getint('Workers', fallback=32),
+                    journal))
+            if journal is not None:
+                journal.close()
+            if _HISTORY_ is not None:
+                _HISTORY_.close()
         except KeyError as e:
             print('You are missing this key value:', e.args[0])
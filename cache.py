@@ -0,0 +1,205 @@
+from collections import Counter, OrderedDict
+from json import loads
+import shelve
+from threading import Lock
+from time import time
+
+# Seconds each endpoint's data stays fresh. Expected values and mark of
+# excellence thresholds are only recalculated every few days while recent
+# activity moves with every battle played. Player and account IDs never
+# change for a given name, so those are kept for a week. Parsed clan rosters
+# are only reused while they match the cached clan listing.
+DEFAULT_TTLS = {
+    'efficiency': 900,
+    'vehicles': 3600,
+    'recent': 600,
+    'trend': 3600,
+    'clan': 900,
+    'roster': 900,
+    'moe': 86400,
+    'wn8': 86400,
+    'playerid': 604800,
+    'accountid': 604800,
+    'tankstats': 900,
+}
+
+
+def cache_key(endpoint, platform, name):
+    r"""
+    Build the cache key for an upstream lookup
+
+    :param str endpoint: Upstream endpoint the data is fetched from
+    :param str platform: Platform name as given in the request
+    :param str name: Player, clan or tank name
+    """
+    return (endpoint, platform.lower(), ' '.join(name.lower().split()))
+
+
+class CachedResponse(object):
+    r"""
+    Minimal, picklable stand-in for a :class:`requests.Response`
+
+    Only the attributes the handlers use are kept so that entries are cheap
+    to hold in memory and to write to disk. ``stale`` is set on copies
+    served after their TTL because the upstream could not be reached.
+    """
+
+    def __init__(self, status_code, content, url, fetched=None, stale=False):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.fetched = time() if fetched is None else fetched
+        self.stale = stale
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.status_code, response.content, response.url)
+
+    def json(self):
+        return loads(self.content.decode('utf8'))
+
+
+class ResponseCache(object):
+    r"""
+    Bounded LRU cache whose entries expire after a per-endpoint TTL
+
+    :param dict ttls: Endpoint to TTL (seconds) overrides
+    :param int default_ttl: TTL for endpoints not listed in ``ttls``
+    :param int maxsize: Maximum number of entries held in memory
+    :param str path: Optional shelf file used to persist entries between runs
+    :param float keep: Seconds expired entries stay on disk, to be served
+                       while their upstream is down
+    """
+
+    def __init__(self, ttls=None, default_ttl=300, maxsize=512, path=None,
+                 keep=86400):
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.maxsize = maxsize
+        self.keep = keep
+        self.entries = OrderedDict()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.shelf = None
+        self.lock = Lock()
+        if path:
+            self.shelf = shelve.open(path)
+            self.prune()
+
+    @classmethod
+    def from_config(cls, section):
+        r"""
+        Build a cache from a configuration section
+
+        TTLs are given as ``Cache TTL <endpoint>`` keys, e.g.
+        ``Cache TTL clan = 600``.
+
+        :param section: ``ConfigParser`` section holding the cache settings
+        """
+        ttls = {}
+        for option in section:
+            if option.startswith('cache ttl '):
+                ttls[option[len('cache ttl '):]] = section.getint(option)
+        return cls(
+            ttls=ttls,
+            default_ttl=section.getint('Cache TTL', fallback=300),
+            maxsize=section.getint('Cache Size', fallback=512),
+            path=section.get('Cache File', fallback=None) or None,
+            keep=section.getfloat('Cache Keep', fallback=86400))
+
+    @staticmethod
+    def _disk_key(key):
+        return '\x1f'.join(key)
+
+    def ttl(self, key):
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def get(self, key):
+        r"""
+        Return the fresh value stored under ``key``, or ``None``
+
+        :param tuple key: Key built with :func:`cache_key`
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.shelf is not None:
+                entry = self.shelf.get(self._disk_key(key))
+                if entry is not None:
+                    self._store(key, entry)
+            if entry is None or entry[0] < time():
+                self.misses[key[0]] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits[key[0]] += 1
+            return entry[1]
+
+    def stale(self, key):
+        r"""
+        Return the value stored under ``key`` even if it has expired
+
+        Used when the upstream cannot be reached. Hit and miss counters are
+        left alone.
+
+        :param tuple key: Key built with :func:`cache_key`
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.shelf is not None:
+                entry = self.shelf.get(self._disk_key(key))
+        return None if entry is None else entry[1]
+
+    def remaining(self, key):
+        r"""
+        Seconds until the entry stored under ``key`` expires, or ``None``
+
+        Expired entries give a negative number. Hit and miss counters are
+        left alone.
+
+        :param tuple key: Key built with :func:`cache_key`
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.shelf is not None:
+                entry = self.shelf.get(self._disk_key(key))
+        if entry is None:
+            return None
+        return entry[0] - time()
+
+    def set(self, key, value):
+        entry = (time() + self.ttl(key), value)
+        with self.lock:
+            self._store(key, entry)
+            if self.shelf is not None:
+                self.shelf[self._disk_key(key)] = entry
+
+    def _store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def prune(self):
+        r"""
+        Drop entries that expired more than ``keep`` seconds ago from the
+        on-disk shelf
+        """
+        now = time() - self.keep
+        for key in [k for k, v in self.shelf.items() if v[0] < now]:
+            del self.shelf[key]
+
+    def stats(self):
+        r"""
+        Hit and miss counters per endpoint
+        """
+        return {
+            endpoint: (self.hits[endpoint], self.misses[endpoint])
+            for endpoint in sorted(set(self.hits) | set(self.misses))
+        }
+
+    def close(self):
+        with self.lock:
+            if self.shelf is not None:
+                self.shelf.close()
+                self.shelf = None
@@ -0,0 +1,283 @@
+import asyncio
+from cache import cache_key
+from collections import defaultdict
+from metrics import METRICS
+from ratings import ExpectedValues
+from re import compile as compile_re
+from threading import Lock
+from time import time
+from unicodedata import combining, normalize as unicode_normalize
+
+# Upstream endpoints listing every tank, by platform
+TANK_URLS = {
+    'ps': 'https://ps.wotclans.com.br/api/tanks/{}',
+    'xbox': 'https://wotclans.com.br/api/tanks/{}',
+}
+# Field that tells whether a tank has data for a tank subcommand
+REQUIRED = {
+    'moe': 'Moe1Dmg',
+    'wn8': 'Damage',
+}
+
+
+_WORD_ = compile_re(r'[^\W_]+')
+
+
+def normalize(text):
+    r"""
+    Reduce a tank name to lowercase letters and digits
+
+    Accents, spaces and punctuation are dropped, so "T-34-85", "t34 85" and
+    "T 34-85" all normalize to "t3485".
+
+    :param str text: Tank name or search text
+    """
+    return ''.join(
+        c for c in unicode_normalize('NFKD', text.lower())
+        if c.isalnum() and not combining(c))
+
+
+def words(text):
+    r"""
+    Normalized words of a tank name or search text
+
+    :param str text: Tank name or search text
+    """
+    return [normalize(word) for word in _WORD_.findall(text)]
+
+
+def ngrams(text, n=3):
+    r"""
+    Set of the ``n``-character substrings of a normalized name
+
+    :param str text: Normalized name
+    :param int n: Length of the substrings
+    """
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class TankCatalog(object):
+    r"""
+    Searchable copy of every tank's MoE and expected values on one platform
+
+    :param list tanks: Tank records as returned by the wotclans API
+    """
+
+    def __init__(self, tanks=()):
+        self.tanks = []
+        self.names = []
+        self.exact = {}
+        self.prefixes = defaultdict(set)
+        self.grams = defaultdict(set)
+        self.updated = time()
+        self._expected = None
+        for tank in tanks:
+            self.add(tank)
+
+    @classmethod
+    def merge(cls, *listings):
+        r"""
+        Build a catalog from several endpoint listings of the same tanks
+
+        Records are matched on ``TankId`` when present and on the name
+        otherwise, so each tank ends up with both its MoE and its expected
+        values.
+
+        :param listings: Lists of tank records
+        """
+        merged = {}
+        for listing in listings:
+            for tank in listing:
+                merged.setdefault(
+                    tank.get('TankId', tank['Name']), {}).update(tank)
+        return cls(merged.values())
+
+    def add(self, tank):
+        index = len(self.tanks)
+        name = normalize(tank['Name'])
+        self.tanks.append(tank)
+        self.names.append(name)
+        self.exact.setdefault(name, index)
+        for word in words(tank['Name']):
+            for end in range(1, len(word) + 1):
+                self.prefixes[word[:end]].add(index)
+        for gram in ngrams(name):
+            self.grams[gram].add(index)
+
+    def __len__(self):
+        return len(self.tanks)
+
+    def expected(self):
+        r"""
+        The WN8 expected values of every tank, built on first use
+
+        :return: :class:`ratings.ExpectedValues`
+        """
+        if self._expected is None:
+            self._expected = ExpectedValues(self.tanks)
+        return self._expected
+
+    def candidates(self, query):
+        # Every tank containing the query contains all of its n-grams
+        if len(query) < 3:
+            return range(len(self.tanks))
+        found = None
+        for gram in ngrams(query):
+            found = self.grams.get(gram, set()) if found is None else \
+                found & self.grams.get(gram, set())
+            if not found:
+                return ()
+        return found
+
+    def abbreviated(self, text):
+        r"""
+        Tanks with a word starting with each word of the search text
+
+        This catches shorthand such as "obj 260" for "Object 260".
+
+        :param str text: Search text
+        """
+        found = None
+        for word in words(text):
+            matches = self.prefixes.get(word, set())
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        return sorted(found or (), key=self.names.__getitem__)
+
+    def similar(self, query, limit=5, cutoff=0.3):
+        r"""
+        Tanks whose names share the most n-grams with the query
+
+        :param str query: Normalized search text
+        :param int limit: Most tanks to return
+        :param float cutoff: Lowest Dice coefficient accepted
+        """
+        grams = ngrams(query)
+        shared = defaultdict(int)
+        for gram in grams:
+            for index in self.grams.get(gram, ()):
+                shared[index] += 1
+        scored = []
+        for index, count in shared.items():
+            score = 2.0 * count / (
+                len(grams) + len(ngrams(self.names[index])))
+            if score >= cutoff:
+                scored.append((-score, self.names[index], index))
+        return [index for _, _, index in sorted(scored)[:limit]]
+
+    def search(self, text, require=None):
+        r"""
+        Find the tanks matching a user's search text
+
+        An exact name match returns just that tank. Otherwise every tank whose
+        name contains the text is returned, failing that every tank with words
+        starting with the words of the text, and finally the closest names by
+        n-gram similarity.
+
+        :param str text: Search text
+        :param str require: Only return tanks with this field
+        :return: List of tank records
+        """
+        query = normalize(text)
+        if not query:
+            return []
+        index = self.exact.get(query)
+        if index is not None and (
+                require is None or require in self.tanks[index]):
+            return [self.tanks[index]]
+        indices = sorted(
+            (i for i in self.candidates(query) if query in self.names[i]),
+            key=self.names.__getitem__)
+        if not indices:
+            indices = self.abbreviated(text)
+        if not indices:
+            indices = self.similar(query)
+        return [
+            self.tanks[i] for i in indices
+            if require is None or require in self.tanks[i]
+        ]
+
+
+class TankCatalogs(object):
+    r"""
+    Tank catalogs for every platform, refreshed from wotclans periodically
+
+    :param float refresh: Seconds before a catalog is downloaded again
+    :param float retry: Seconds to wait after a failed download
+    """
+
+    def __init__(self, refresh=86400, retry=300):
+        self.refresh = refresh
+        self.retry = retry
+        self.catalogs = {}
+        self.attempts = {}
+        self.failed = set()
+        self.lock = Lock()
+
+    def outdated(self, platform):
+        r"""
+        Whether the last download of a platform's catalog failed, so the
+        catalog in use is older than it should be
+
+        :param str platform: Platform name
+        """
+        return platform in self.failed
+
+    async def download(self, session, platform):
+        r"""
+        Fetch every tank listing for a platform at once
+
+        The listings are cached under the ``moe`` and ``wn8`` endpoints with
+        an empty name, so a one-shot run reuses the listings cached by the
+        previous runs instead of downloading them again.
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name
+        :return: New :class:`TankCatalog`, or ``None`` if a listing failed
+        """
+        responses = await asyncio.gather(*(
+            session.get(
+                TANK_URLS[platform].format(endpoint),
+                key=cache_key(endpoint, platform, ''))
+            for endpoint in REQUIRED))
+        listings = []
+        for r in responses:
+            if r.status_code != 200:
+                return None
+            with METRICS.timer('decode'):
+                listings.append(r.json()['Tanks'])
+        return TankCatalog.merge(*listings)
+
+    async def get(self, session, platform):
+        r"""
+        Return the catalog for a platform, refreshing it when it is stale
+
+        Only one caller downloads a stale catalog; everyone else keeps using
+        the old one in the meantime.
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name
+        :return: :class:`TankCatalog`, or ``None`` if none could be loaded
+        """
+        with self.lock:
+            catalog = self.catalogs.get(platform)
+            now = time()
+            if catalog is not None and now - catalog.updated < self.refresh:
+                return catalog
+            if now - self.attempts.get(platform, 0) < self.retry:
+                return catalog
+            self.attempts[platform] = now
+        try:
+            fresh = await self.download(session, platform)
+        except (KeyError, ValueError, IOError):
+            fresh = None
+        with self.lock:
+            if not fresh:
+                self.failed.add(platform)
+                return catalog
+            self.failed.discard(platform)
+            self.catalogs[platform] = fresh
+        return fresh
@@ -0,0 +1,224 @@
+from collections import namedtuple
+
+# Most entries a "top" request may ask for
+TOP_LIMIT = 50
+# Most days a "progress" or "growth" request may look back
+DAYS_LIMIT = 365
+# Most comma-separated names a single mention may ask about
+BATCH_LIMIT = 10
+
+Platform = namedtuple('Platform', 'name wotinfo wotclans')
+PS = Platform('ps', 'ps4', 'ps')
+XBOX = Platform('xbox', 'xbox', 'xbox')
+# Every spelling of a platform we accept, with the name each upstream uses
+PLATFORMS = {
+    'ps': PS,
+    'ps4': PS,
+    'xbox': XBOX,
+}
+
+Request = namedtuple(
+    'Request',
+    'handler bot command platform subcommand name names count field')
+
+MISSING = 'Something is wrong with your request. Please retry!'
+BAD_PLATFORM = 'Bad platform. Please use "ps" or "xbox" and try again!'
+BAD_SUBCOMMAND = 'Bad subcommand request "{}". Please retry!'
+BAD_FIELD = 'Bad sort field "{}". Please use one of: {}'
+BAD_BATCH = (
+    'Only these commands accept several comma-separated names: {}. Please '
+    'retry with a single name!')
+TOO_MANY = 'Please ask about at most {} names at once!'
+UNKNOWN = """Oops! Your first command is not valid. Please review your
+spelling and try again. If you continue to have this issue, please
+check the wiki over at /r/{} or ask a mod there for help."""
+
+
+class Subcommand(object):
+    r"""
+    One subcommand of a command and the handler answering it
+
+    :param handler: Function called with the :class:`Request` and the
+                    :class:`transport.Transport`
+    :param int count: Entries shown by default. When given, the subcommand
+                      accepts the optional ``[N] [by FIELD]`` arguments.
+    :param fields: Names that ``by FIELD`` accepts
+    :param batch: Handler answering a request for several comma-separated
+                  names at once. Only a single name is accepted without one.
+    :param int days: Days looked back by default. When given, the subcommand
+                     accepts the optional ``[DAYS]`` argument, which is
+                     passed on as the request's count.
+    """
+
+    def __init__(self, handler, count=None, fields=(), batch=None,
+                 days=None):
+        self.handler = handler
+        self.count = count
+        self.fields = fields
+        self.batch = batch
+        self.days = days
+
+
+class Command(object):
+    r"""
+    A command and the syntax of its arguments
+
+    Commands without subcommands take no arguments at all. Every other command
+    is written ``COMMAND PLAT SUBCOMMAND [OPTIONS] NAME``, where a subcommand
+    may be two words long (e.g. "tanks top").
+
+    :param handler: Function answering the command when it has no
+                    subcommands
+    :param dict subcommands: :class:`Subcommand` by name
+    :param str missing: Reply when an argument is missing
+    :param str invalid: Reply to an unknown subcommand. Formatted with the
+                        subcommand and the list of valid subcommands.
+    :param int words: Most words of each name to use. All of them are used
+                      when omitted.
+    """
+
+    def __init__(self, handler=None, subcommands=None, missing=MISSING,
+                 invalid=BAD_SUBCOMMAND, words=None):
+        self.handler = handler
+        self.subcommands = subcommands
+        self.missing = missing
+        self.invalid = invalid
+        self.words = words
+        self.groups = frozenset(
+            name.split()[0] for name in subcommands or () if ' ' in name)
+
+
+def top_options(tokens, count):
+    r"""
+    Split the optional ``[N] [by FIELD]`` arguments off a top request
+
+    :param list tokens: Request tokens following the subcommand
+    :param int count: Number of entries shown when no N is given
+    :return: Tuple of count, field (or ``None``) and the remaining tokens
+    """
+    field = None
+    if len(tokens) > 1 and tokens[0].isdigit():
+        count = max(1, min(int(tokens[0]), TOP_LIMIT))
+        tokens = tokens[1:]
+    if len(tokens) > 2 and tokens[0] == 'by':
+        field = tokens[1]
+        tokens = tokens[2:]
+    return count, field, tokens
+
+
+def day_options(tokens, days):
+    r"""
+    Split the optional ``[DAYS]`` argument off a request
+
+    :param list tokens: Request tokens following the subcommand
+    :param int days: Number of days used when none are given
+    :return: Tuple of the number of days and the remaining tokens
+    """
+    if len(tokens) > 1 and tokens[0].isdigit():
+        return max(1, min(int(tokens[0]), DAYS_LIMIT)), tokens[1:]
+    return days, tokens
+
+
+def batched(commands):
+    r"""
+    List the commands that accept several names, e.g. "clan summary"
+
+    :param dict commands: :class:`Command` by name
+    """
+    return ', '.join(
+        '{} {}'.format(name, subname)
+        for name, command in commands.items()
+        for subname, subcommand in (command.subcommands or {}).items()
+        if subcommand.batch is not None)
+
+
+def names(args, words=None):
+    r"""
+    Split the comma-separated names at the end of a request
+
+    :param list args: Request tokens holding the names
+    :param int words: Most words of each name to keep
+    :return: List of distinct names, in the order given
+    """
+    found = []
+    for part in ' '.join(args).split(','):
+        name = ' '.join(part.split()[:words])
+        if name and name not in found:
+            found.append(name)
+    return found
+
+
+def resolve(tokens, commands, responses, default='help'):
+    r"""
+    Work out what a message asks for in a single pass over its words
+
+    Everything is validated here, so a malformed mention is answered without
+    any upstream request being made. A request for several comma-separated
+    names is handed to the batch handler of its subcommand, with the names in
+    ``Request.names``.
+
+    :param list tokens: Lowercase words of the message
+    :param dict commands: :class:`Command` by name
+    :param dict responses: Handlers by first word for messages that are not
+                           mentions, e.g. "good bot"
+    :param str default: Command answering a bare mention
+    :return: :class:`Request` to hand to its handler, a reply explaining
+             what is wrong with the message, or ``None`` if it should be
+             ignored
+    """
+    if not tokens:
+        return None
+    bot = tokens[0].split('/')[-1]
+    if len(tokens) == 1:
+        return Request(
+            commands[default].handler, bot, default, None, None, None, None,
+            None, None)
+    if '/' not in tokens[0]:
+        handler = responses.get(tokens[0])
+        if handler is None:
+            return None
+        return Request(
+            handler, bot, tokens[0], None, None, None, None, None, None)
+    command = commands.get(tokens[1])
+    if command is None:
+        return UNKNOWN.format(bot)
+    if command.subcommands is None:
+        return Request(
+            command.handler, bot, tokens[1], None, None, None, None, None,
+            None)
+    if len(tokens) < 3:
+        return command.missing
+    platform = PLATFORMS.get(tokens[2])
+    if platform is None:
+        return BAD_PLATFORM
+    if len(tokens) < 4:
+        return command.missing
+    subcommand, args = tokens[3], tokens[4:]
+    if subcommand in command.groups:
+        if not args:
+            return command.missing
+        subcommand, args = '{} {}'.format(subcommand, args[0]), args[1:]
+    found = command.subcommands.get(subcommand)
+    if found is None:
+        return command.invalid.format(
+            subcommand.split()[-1], ', '.join(command.subcommands))
+    count = field = None
+    if found.count is not None:
+        count, field, args = top_options(args, found.count)
+        if field is not None and field not in found.fields:
+            return BAD_FIELD.format(field, ', '.join(sorted(found.fields)))
+    elif found.days is not None:
+        count, args = day_options(args, found.days)
+    found_names = names(args, command.words)
+    if not found_names:
+        return command.missing
+    handler = found.handler
+    if len(found_names) > 1:
+        if found.batch is None:
+            return BAD_BATCH.format(batched(commands))
+        if len(found_names) > BATCH_LIMIT:
+            return TOO_MANY.format(BATCH_LIMIT)
+        handler = found.batch
+    return Request(
+        handler, bot, tokens[1], platform, subcommand, found_names[0],
+        tuple(found_names), count, field)
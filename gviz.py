@@ -0,0 +1,71 @@
+# Parser for the Google Visualization rows embedded in wotinfo pages.
+#
+# wotinfo renders its vehicle table client-side from a long run of
+# ``data.addRow([...]);`` calls. Rather than rewriting each call into JSON and
+# decoding it, a single precompiled pattern captures just the cells we report
+# straight out of the script source.
+from collections import namedtuple
+import re
+
+Vehicle = namedtuple('Vehicle', [
+    'tier', 'mastery', 'name', 'type', 'win_rate', 'wins', 'battles',
+    'damage', 'share', 'efficiency', 'wn8'])
+
+RANKS = {
+    'rank_01.png': '1',
+    'rank_02.png': '2',
+    'rank_03.png': '3',
+    'rank_m.png': 'M',
+    'FFFFFF-0.png': ''
+}
+
+_ROW_ = re.compile(r"""
+    data\.addRow\(\[\s*
+    (-?[\d.]+)\s*,\s*                           # tier
+    '[^'"]*"(?:[^"]*/)?([^/"]*)"[^']*'\s*,\s*   # mastery badge image
+    (?:'[^']*'|[^,]*)\s*,\s*
+    '[^'>]*>([^<']*)<[^']*'\s*,\s*              # vehicle name, link text
+    (?:'[^']*'|[^,]*)\s*,\s*
+    '[^']*/([^/".]*)[^/"]*"[^"']*'\s*,\s*       # vehicle class image
+    \{[^}']*'([^']*)'\s*\}\s*,\s*               # win rate
+    (-?[\d.]+)\s*,\s*                           # wins
+    (-?[\d.]+)\s*,\s*                           # battles
+    (-?[\d.]+)\s*,\s*                           # average damage
+    \{[^}']*'([^']*)'\s*\}\s*,\s*               # share of all battles
+    \{\s*v\s*:\s*(-?[\d.]+)[^}]*\}\s*,\s*       # efficiency
+    \{\s*v\s*:\s*(-?[\d.]+)[^}]*\}              # WN8
+    [^\]]*\]\);
+    """, re.X)
+
+
+def _number(text):
+    if '.' in text:
+        return float(text)
+    return int(text)
+
+
+def vehicles(text):
+    r"""
+    Extract every vehicle added to the table in a wotinfo vehicles page
+
+    Rows that do not have the expected layout are skipped.
+
+    :param str text: Decoded page source
+    :return: List of :class:`Vehicle`
+    """
+    return [
+        Vehicle(
+            _number(tier),
+            RANKS.get(badge, ''),
+            name,
+            kind,
+            rate,
+            _number(wins),
+            _number(battles),
+            _number(damage),
+            share,
+            _number(eff),
+            _number(wn8))
+        for tier, badge, name, kind, rate, wins, battles, damage, share, eff,
+        wn8 in _ROW_.findall(text)
+    ]
@@ -0,0 +1,147 @@
+import sqlite3
+from time import time
+
+
+def entity_key(name):
+    r"""
+    Normalize a player or clan name the way cache keys do
+
+    :param str name: Player or clan name
+    """
+    return ' '.join(name.lower().split())
+
+
+class History(object):
+    r"""
+    Append-only record of the player and clan stats we have fetched
+
+    Each snapshot only writes the stats that changed since the previous one,
+    so looking up the same clan every few minutes costs nothing until its
+    numbers move. Rows are indexed by kind, platform, entity and time, so the
+    stats as of any moment can be rebuilt without asking the upstream again.
+
+    :param str path: SQLite database file
+    """
+
+    def __init__(self, path='history.db'):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        # value is left untyped so numbers and text keep their type
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS snapshots ('
+            'kind TEXT NOT NULL, '
+            'platform TEXT NOT NULL, '
+            'entity TEXT NOT NULL, '
+            'taken REAL NOT NULL, '
+            'field TEXT NOT NULL, '
+            'value)')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS snapshots_by_entity '
+            'ON snapshots (kind, platform, entity, taken)')
+        # Latest known stats by (kind, platform, entity), so recording a
+        # snapshot does not need to read the database
+        self.latest = {}
+
+    @classmethod
+    def from_config(cls, section):
+        r"""
+        Open the history named in a configuration section
+
+        :param section: ``ConfigParser`` section holding the history settings
+        :return: :class:`History`, or ``None`` if ``History File`` is empty
+        """
+        path = section.get('History File', fallback='history.db')
+        if not path:
+            return None
+        return cls(path)
+
+    def record(self, kind, platform, name, stats, taken=None):
+        r"""
+        Store a snapshot, writing only the stats that changed
+
+        :param str kind: ``player`` or ``clan``
+        :param str platform: Platform name
+        :param str name: Player or clan name
+        :param dict stats: Stat name to value
+        :param float taken: When the stats were fetched. Defaults to now.
+        :return: Number of stats written
+        """
+        key = (kind, platform, entity_key(name))
+        taken = time() if taken is None else taken
+        previous = self.latest.get(key)
+        if previous is None:
+            previous = self.state(kind, platform, name, taken)
+        changed = [
+            (field, value) for field, value in stats.items()
+            if field not in previous or previous[field] != value]
+        if changed:
+            self.db.executemany(
+                'INSERT INTO snapshots '
+                '(kind, platform, entity, taken, field, value) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [key + (taken, field, value) for field, value in changed])
+        self.latest[key] = dict(previous, **stats)
+        return len(changed)
+
+    def state(self, kind, platform, name, at=None):
+        r"""
+        Rebuild the stats as they stood at a given time
+
+        :param str kind: ``player`` or ``clan``
+        :param str platform: Platform name
+        :param str name: Player or clan name
+        :param float at: Time to look at. Defaults to now.
+        :return: Stat name to value, empty if nothing was recorded by then
+        """
+        # SQLite takes the bare columns from the row holding the MAX()
+        rows = self.db.execute(
+            'SELECT field, value, MAX(taken) FROM snapshots '
+            'WHERE kind = ? AND platform = ? AND entity = ? AND taken <= ? '
+            'GROUP BY field',
+            (kind, platform, entity_key(name),
+             time() if at is None else at))
+        return {field: value for field, value, _ in rows}
+
+    def first(self, kind, platform, name):
+        r"""
+        When the first snapshot of an entity was taken, or ``None``
+
+        :param str kind: ``player`` or ``clan``
+        :param str platform: Platform name
+        :param str name: Player or clan name
+        """
+        row = self.db.execute(
+            'SELECT MIN(taken) FROM snapshots '
+            'WHERE kind = ? AND platform = ? AND entity = ?',
+            (kind, platform, entity_key(name))).fetchone()
+        return row[0]
+
+    def timeline(self, kind, platform, name, since):
+        r"""
+        The stats after every snapshot taken since a given time
+
+        :param str kind: ``player`` or ``clan``
+        :param str platform: Platform name
+        :param str name: Player or clan name
+        :param float since: Start of the period
+        :return: List of ``(taken, stats)`` pairs, oldest first. The first
+                 pair holds the stats as they stood at ``since``, if any
+                 were recorded by then.
+        """
+        state = self.state(kind, platform, name, since)
+        timeline = [(since, dict(state))] if state else []
+        rows = self.db.execute(
+            'SELECT taken, field, value FROM snapshots '
+            'WHERE kind = ? AND platform = ? AND entity = ? AND taken > ? '
+            'ORDER BY taken',
+            (kind, platform, entity_key(name), since))
+        for taken, field, value in rows:
+            if not timeline or timeline[-1][0] != taken:
+                timeline.append((taken, dict(state)))
+            state[field] = value
+            timeline[-1][1][field] = value
+        return timeline
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,112 @@
+from json import dumps, loads
+import sqlite3
+from time import time
+
+
+class Journal(object):
+    r"""
+    Record of the mentions we have answered, kept across runs
+
+    A message is journaled with the pages of its rendered reply before the
+    reply is posted, each page is recorded as it is posted, and the message
+    is marked as replied once every page has been. If the bot dies or a
+    Reddit call fails in between, the next run posts the pages that are
+    still missing (or, if all were posted, just marks the message read)
+    instead of answering the mention again.
+
+    :param str path: SQLite database file
+    :param float keep: Seconds entries are kept for
+    """
+
+    def __init__(self, path='journal.db', keep=2592000):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'id TEXT PRIMARY KEY, '
+            'response TEXT, '
+            'replied INTEGER NOT NULL DEFAULT 0, '
+            'updated REAL NOT NULL, '
+            'posted INTEGER NOT NULL DEFAULT 0, '
+            'parent TEXT)')
+        self.keep = keep
+        self.prune()
+
+    @classmethod
+    def from_config(cls, section):
+        r"""
+        Open the journal named in a configuration section
+
+        :param section: ``ConfigParser`` section holding the journal settings
+        :return: :class:`Journal`, or ``None`` if ``Journal File`` is empty
+        """
+        path = section.get('Journal File', fallback='journal.db')
+        if not path:
+            return None
+        return cls(path, section.getfloat('Journal Keep', fallback=2592000))
+
+    def get(self, id):
+        r"""
+        Look up a message
+
+        :param str id: Reddit ID of the message
+        :return: Tuple of whether the whole reply was posted, the pages of
+                 the stored reply (``None`` if the message needs none), how
+                 many of them were posted and the ID of the comment holding
+                 the last one, or ``None`` if the message was never handled
+        """
+        row = self.db.execute(
+            'SELECT replied, response, posted, parent FROM messages '
+            'WHERE id = ?', (id,)).fetchone()
+        if row is None:
+            return None
+        replied, response, posted, parent = row
+        pages = None if response is None else loads(response)
+        return bool(replied), pages, posted, parent
+
+    def rendered(self, id, pages):
+        r"""
+        Store the reply to a message before it is posted
+
+        :param str id: Reddit ID of the message
+        :param list pages: Comments making up the reply, or ``None`` if the
+                           message needs none
+        """
+        self.db.execute(
+            'INSERT OR REPLACE INTO messages '
+            '(id, response, replied, updated, posted, parent) '
+            'VALUES (?, ?, 0, ?, 0, NULL)',
+            (id, None if pages is None else dumps(pages), time()))
+
+    def posted(self, id, count, parent):
+        r"""
+        Note that another page of the reply to a message has been posted
+
+        :param str id: Reddit ID of the message
+        :param int count: Number of pages posted so far
+        :param str parent: Reddit ID of the comment holding the last of them
+        """
+        self.db.execute(
+            'UPDATE messages SET posted = ?, parent = ?, updated = ? '
+            'WHERE id = ?', (count, parent, time(), id))
+
+    def replied(self, id):
+        r"""
+        Note that the reply to a message has been posted
+
+        :param str id: Reddit ID of the message
+        """
+        self.db.execute(
+            'UPDATE messages SET replied = 1, updated = ? WHERE id = ?',
+            (time(), id))
+
+    def prune(self):
+        r"""
+        Forget messages handled more than ``keep`` seconds ago
+        """
+        self.db.execute(
+            'DELETE FROM messages WHERE updated < ?', (time() - self.keep,))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,260 @@
+from asyncio import iscoroutinefunction
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock, Thread
+from time import perf_counter
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in labels)
+
+
+class _Series(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.peak = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class _Request(object):
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.spent = 0.0
+
+
+class Metrics(object):
+    r"""
+    Latency histograms for each stage of answering a mention
+
+    Observations are labelled with the stage and with the command and
+    platform of the request being handled in the current context (thread or
+    task), so it is easy to tell whether wotinfo, wotclans or Reddit is
+    holding replies up.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.series = {}
+        self.current = ContextVar('request', default=None)
+
+    def observe(self, stage, seconds, **labels):
+        r"""
+        Record how long a stage took
+
+        :param str stage: Stage name, e.g. ``fetch`` or ``decode``
+        :param float seconds: Time spent
+        :param labels: Labels added to those of the current request
+        """
+        context = self.current.get()
+        if context is not None:
+            labels = dict(context.labels, **labels)
+        labels['stage'] = stage
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series()
+            series.count += 1
+            series.total += seconds
+            series.peak = max(series.peak, seconds)
+            index = bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                series.buckets[index] += 1
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        r"""
+        Time the body of a ``with`` block as a stage
+
+        :param str stage: Stage name
+        :param labels: Labels added to those of the current request
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.observe(stage, elapsed, **labels)
+            context = self.current.get()
+            if context is not None:
+                context.spent += elapsed
+
+    @contextmanager
+    def request(self, **labels):
+        r"""
+        Label everything timed in this context until the block exits
+
+        The whole block is recorded as the ``total`` stage and the time not
+        spent in other timed stages as the ``format`` stage.
+
+        :param labels: Labels describing the request, e.g. command and
+                       platform
+        """
+        context = _Request(labels)
+        token = self.current.set(context)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.observe('format', elapsed - context.spent)
+            self.observe('total', elapsed)
+            self.current.reset(token)
+
+    def label(self, **labels):
+        r"""
+        Add labels to the request being handled in this context
+
+        :param labels: Labels to add or replace
+        """
+        context = self.current.get()
+        if context is not None:
+            context.labels.update(labels)
+
+    def wrap(self, function):
+        r"""
+        Make ``function`` label its timings like the current request
+
+        Use it to hand work for the current request to another thread or
+        task. The time spent there is not counted against the request's
+        ``format`` stage, so time the hand-off itself instead.
+
+        :param function: Function or coroutine function to wrap
+        """
+        context = self.current.get()
+        labels = None if context is None else context.labels
+
+        def enter():
+            return self.current.set(
+                None if labels is None else _Request(dict(labels)))
+
+        if iscoroutinefunction(function):
+            async def wrapper(*args, **kwargs):
+                token = enter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.current.reset(token)
+        else:
+            def wrapper(*args, **kwargs):
+                token = enter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.current.reset(token)
+        return wrapper
+
+    def render(self, cache=None):
+        r"""
+        Format every series in the Prometheus text exposition format
+
+        :param cache: Optional :class:`cache.ResponseCache` whose hit and
+                      miss counters are included
+        """
+        lines = [
+            '# HELP wotc_stage_seconds Time spent in each stage of answering '
+            'a mention',
+            '# TYPE wotc_stage_seconds histogram',
+        ]
+        with self.lock:
+            for key in sorted(self.series):
+                series = self.series[key]
+                cumulative = 0
+                for bound, count in zip(BUCKETS, series.buckets):
+                    cumulative += count
+                    lines.append('wotc_stage_seconds_bucket{{{},le="{}"}} {}'
+                                 .format(_labels(key), bound, cumulative))
+                lines.append('wotc_stage_seconds_bucket{{{},le="+Inf"}} {}'
+                             .format(_labels(key), series.count))
+                lines.append('wotc_stage_seconds_sum{{{}}} {}'.format(
+                    _labels(key), series.total))
+                lines.append('wotc_stage_seconds_count{{{}}} {}'.format(
+                    _labels(key), series.count))
+        if cache is not None:
+            lines.append('# HELP wotc_cache_requests_total Response cache '
+                         'lookups')
+            lines.append('# TYPE wotc_cache_requests_total counter')
+            for endpoint, (hits, misses) in cache.stats().items():
+                for result, count in (('hit', hits), ('miss', misses)):
+                    lines.append(
+                        'wotc_cache_requests_total{{{}}} {}'.format(
+                            _labels((('endpoint', endpoint),
+                                     ('result', result))), count))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        r"""
+        One line with the call count, mean and worst time of every stage
+        """
+        totals = {}
+        with self.lock:
+            for key, series in self.series.items():
+                labels = dict(key)
+                name = labels.pop('stage')
+                if 'host' in labels:
+                    name = '{}[{}]'.format(name, labels['host'])
+                elif 'command' in labels:
+                    name = '{}[{}]'.format(name, labels['command'])
+                count, total, peak = totals.get(name, (0, 0.0, 0.0))
+                totals[name] = (
+                    count + series.count,
+                    total + series.total,
+                    max(peak, series.peak))
+        return ' | '.join(
+            '{} n={} avg={:.0f}ms max={:.0f}ms'.format(
+                name, count, 1000 * total / count, 1000 * peak)
+            for name, (count, total, peak) in sorted(totals.items()))
+
+
+METRICS = Metrics()
+
+
+def serve_metrics(port, metrics=METRICS, cache=None, address='127.0.0.1'):
+    r"""
+    Expose ``/metrics`` over HTTP from a background thread
+
+    :param int port: Port to listen on
+    :param metrics: :class:`Metrics` to expose
+    :param cache: Optional :class:`cache.ResponseCache` to include
+    :param str address: Address to bind to
+    :return: The running server
+    """
+    # http.server is only loaded by runs that serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = self.server.metrics.render(
+                self.server.cache).encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    server.cache = cache
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,129 @@
+import asyncio
+from collections import Counter, deque
+import logging
+from threading import Lock
+from time import monotonic
+
+from cache import cache_key
+
+
+class Prefetcher(object):
+    r"""
+    Keep the most asked-about clans and the tank catalogs warm
+
+    Clan lookups are counted as they are answered. While the bot is idle,
+    the pinned clans and the most asked-about recent ones are fetched again
+    shortly before their cache entries expire, and stale tank catalogs are
+    downloaded, so the next person asking gets an answer from the cache.
+
+    :param dict urls: Clan lookup endpoint, by platform
+    :param catalogs: :class:`catalog.TankCatalogs` to keep fresh
+    :param pinned: ``(platform, tag)`` pairs that are always kept warm
+    :param int size: Most clans kept warm besides the pinned ones
+    :param int window: Number of recent clan lookups counted
+    :param float interval: Seconds between warm-ups. Nothing is prefetched
+                           when 0.
+    """
+
+    def __init__(self, urls, catalogs, pinned=(), size=10, window=500,
+                 interval=300):
+        self.urls = urls
+        self.catalogs = catalogs
+        self.pinned = list(pinned)
+        self.size = size
+        self.interval = interval
+        self.recent = deque(maxlen=window)
+        self.counts = Counter()
+        self.lock = Lock()
+        self.running = False
+        self.task = None
+        self.last = monotonic()
+
+    def configure(self, section):
+        r"""
+        Apply the settings of a configuration section
+
+        Pinned clans are given as ``Prefetch Clans = xbox:RDDT, ps:ABC``.
+
+        :param section: ``ConfigParser`` section holding the prefetch settings
+        """
+        self.pinned = []
+        for entry in section.get('Prefetch Clans', fallback='').split(','):
+            platform, _, tag = entry.strip().lower().partition(':')
+            if tag and platform in self.urls:
+                self.pinned.append((platform, tag))
+        self.size = section.getint('Prefetch Size', fallback=10)
+        self.interval = section.getfloat('Prefetch Interval', fallback=300)
+
+    def record(self, platform, tag):
+        r"""
+        Count a clan lookup
+
+        :param str platform: wotclans platform name
+        :param str tag: Clan tag
+        """
+        entry = (platform, tag.lower())
+        with self.lock:
+            if len(self.recent) == self.recent.maxlen:
+                old = self.recent[0]
+                self.counts[old] -= 1
+                if not self.counts[old]:
+                    del self.counts[old]
+            self.recent.append(entry)
+            self.counts[entry] += 1
+
+    def hot(self):
+        r"""
+        The clans to keep warm, pinned ones first
+        """
+        with self.lock:
+            popular = [
+                entry for entry, _ in self.counts.most_common()
+                if entry not in self.pinned][:self.size]
+        return self.pinned + popular
+
+    def schedule(self, session):
+        r"""
+        Start a warm-up in the background if one is due
+
+        Must be called from a running event loop.
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :return: True if a warm-up was started
+        """
+        with self.lock:
+            if not self.interval or self.running or \
+                    monotonic() - self.last < self.interval:
+                return False
+            self.running = True
+        # Keep a reference, as the event loop only holds weak ones to tasks
+        self.task = asyncio.ensure_future(self.warm(session))
+        return True
+
+    async def warm(self, session):
+        r"""
+        Refresh every hot clan that would expire before the next warm-up,
+        and every stale tank catalog
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        """
+        logger = logging.getLogger('Bot')
+        try:
+            refreshed = 0
+            for platform, tag in self.hot():
+                key = cache_key('clan', platform, tag)
+                if session.cache is not None:
+                    left = session.cache.remaining(key)
+                    if left is not None and left > self.interval:
+                        continue
+                await session.refresh(self.urls[platform] + tag, key=key)
+                refreshed += 1
+            for platform in self.urls:
+                await self.catalogs.get(session, platform)
+            logger.debug('Prefetched {} clans'.format(refreshed))
+        except Exception:
+            logger.warning('Prefetch failed', exc_info=True)
+        finally:
+            with self.lock:
+                self.running = False
+                self.last = monotonic()
@@ -0,0 +1,43 @@
+from heapq import heappush, heapreplace, nlargest
+
+
+def top(iterable, k, key=None):
+    r"""
+    Return the ``k`` largest items, best first
+
+    Equivalent to ``sorted(iterable, key=key, reverse=True)[:k]`` but only
+    ever holds ``k`` items instead of sorting everything.
+
+    :param iter iterable: Items to rank
+    :param int k: Number of items to keep
+    :param key: Function returning the value to rank an item by
+    """
+    return nlargest(k, iterable, key=key)
+
+
+def rankings(iterable, k, keys):
+    r"""
+    Rank the same items by several keys in a single pass
+
+    Ties keep their original order, as with :func:`top`.
+
+    :param iter iterable: Items to rank
+    :param int k: Number of items to keep in each ranking
+    :param dict keys: Ranking name to key function
+    :return: Ranking name to the ``k`` largest items, best first
+    """
+    heaps = {name: [] for name in keys}
+    for index, item in enumerate(iterable):
+        for name, key in keys.items():
+            # The negated index breaks ties in favour of earlier items and
+            # keeps the items themselves from ever being compared.
+            entry = (key(item), -index, item)
+            heap = heaps[name]
+            if len(heap) < k:
+                heappush(heap, entry)
+            elif entry > heap[0]:
+                heapreplace(heap, entry)
+    return {
+        name: [entry[2] for entry in sorted(heap, reverse=True)]
+        for name, heap in heaps.items()
+    }
@@ -0,0 +1,218 @@
+from array import array
+from math import exp, log
+from operator import mul
+
+# Expected values kept from a wotclans wn8 listing
+EXPECTED = ('Damage', 'Spot', 'Frag', 'Def', 'WinRate')
+# Per-tank totals read from the Wargaming API's tanks/stats
+STATS = (
+    'battles', 'wins', 'damage_dealt', 'frags', 'spotted',
+    'dropped_capture_points', 'capture_points')
+
+
+def _take(column, indices):
+    if indices is None:
+        return column
+    return array(column.typecode, [column[index] for index in indices])
+
+
+def wn8(actual, expected):
+    r"""
+    WN8 of a set of battles
+
+    :param dict actual: Totals of the :data:`STATS` over the battles
+    :param dict expected: Sums of each expected value times the battles
+                          played in its tank
+    """
+    if not expected['Damage']:
+        return 0.0
+    damage = actual['damage_dealt'] / expected['Damage']
+    spot = actual['spotted'] / expected['Spot']
+    frag = actual['frags'] / expected['Frag']
+    defense = actual['dropped_capture_points'] / expected['Def']
+    win = actual['wins'] / expected['WinRate']
+    damage = max(0, (damage - 0.22) / (1 - 0.22))
+    win = max(0, (win - 0.71) / (1 - 0.71))
+    frag = max(0, min(damage + 0.2, (frag - 0.12) / (1 - 0.12)))
+    spot = max(0, min(damage + 0.1, (spot - 0.38) / (1 - 0.38)))
+    defense = max(0, min(damage + 0.1, (defense - 0.10) / (1 - 0.10)))
+    return (
+        980 * damage + 210 * damage * frag + 155 * frag * spot +
+        75 * defense * frag + 145 * min(1.8, win))
+
+
+def wn7(actual):
+    r"""
+    WN7 of a set of battles
+
+    :param dict actual: Totals of the :data:`STATS` over the battles, plus
+                        ``tier``, the sum of each battle's tier
+    """
+    battles = actual['battles']
+    if not battles:
+        return 0.0
+    tier = actual['tier'] / battles
+    win_rate = 100 * actual['wins'] / battles
+    return (
+        (1240 - 1040 / min(tier, 6) ** 0.164) * actual['frags'] / battles +
+        actual['damage_dealt'] / battles * 530 /
+        (184 * exp(0.24 * tier) + 130) +
+        actual['spotted'] / battles * 125 * min(tier, 3) / 3 +
+        min(actual['dropped_capture_points'] / battles, 2.2) * 100 +
+        (185 / (0.17 + exp((win_rate - 35) * -0.134)) - 500) * 0.45 -
+        (5 - min(tier, 5)) * 125 /
+        (1 + exp((tier - (battles / 220) ** (3 / tier)) * 1.5)))
+
+
+def efficiency(actual):
+    r"""
+    Efficiency rating of a set of battles
+
+    :param dict actual: Totals of the :data:`STATS` over the battles, plus
+                        ``tier``, the sum of each battle's tier
+    """
+    battles = actual['battles']
+    if not battles:
+        return 0.0
+    tier = actual['tier'] / battles
+    return (
+        actual['damage_dealt'] / battles * (10 / (tier + 2)) *
+        (0.23 + 2 * tier / 100) +
+        actual['frags'] / battles * 250 +
+        actual['spotted'] / battles * 150 +
+        log(actual['capture_points'] / battles + 1, 1.732) * 150 +
+        actual['dropped_capture_points'] / battles * 150)
+
+
+class ExpectedValues(object):
+    r"""
+    Every tank's WN8 expected values and tier, stored column by column
+
+    Built once per tank catalog, so rating an account only needs its
+    per-tank stats. Win rates are kept as fractions, whichever way the
+    listing gives them.
+
+    :param tanks: Tank records. Only those with a ``TankId``, a tier and
+                  expected values are kept.
+    """
+
+    __slots__ = ('index', 'tiers', 'columns')
+
+    def __init__(self, tanks):
+        tanks = [
+            tank for tank in tanks
+            if tank.get('TankId') is not None and tank.get('Tier') and
+            all(tank.get(field) is not None for field in EXPECTED)
+        ]
+        self.index = {tank['TankId']: i for i, tank in enumerate(tanks)}
+        self.tiers = array('b', [tank['Tier'] for tank in tanks])
+        self.columns = {
+            field: array('d', [float(tank[field]) for tank in tanks])
+            for field in EXPECTED
+        }
+        self.columns['WinRate'] = array('d', [
+            rate / 100 if rate > 1 else rate
+            for rate in self.columns['WinRate']])
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def rate(self, tanks):
+        r"""
+        Line up an account's per-tank stats with the expected values
+
+        Tanks without expected values or battles are left out, as they
+        cannot be rated.
+
+        :param list tanks: Per-tank stats from
+                           :meth:`wargaming.WargamingAPI.tank_stats`
+        :return: :class:`Ratings`
+        """
+        return Ratings(self, tanks)
+
+
+class Ratings(object):
+    r"""
+    WN8, WN7 and efficiency of an account, over any subset of its tanks
+
+    The account's stats and the expected values of its tanks are packed
+    into parallel arrays, so a rating sums a handful of columns instead of
+    walking a dictionary per tank.
+
+    :param table: :class:`ExpectedValues` of the account's platform
+    :param list tanks: Per-tank stats from
+                       :meth:`wargaming.WargamingAPI.tank_stats`
+    """
+
+    __slots__ = ('tank_ids', 'tiers', 'stats', 'expected')
+
+    def __init__(self, table, tanks):
+        rows = [
+            (tank['tank_id'], table.index[tank['tank_id']], tank['all'])
+            for tank in tanks
+            if tank['tank_id'] in table.index and tank['all'].get('battles')
+        ]
+        self.tank_ids = array('q', [tank_id for tank_id, _, _ in rows])
+        self.tiers = array('b', [table.tiers[index] for _, index, _ in rows])
+        self.stats = {
+            field: array('d', [stats.get(field) or 0 for _, _, stats in rows])
+            for field in STATS
+        }
+        self.expected = {
+            field: array('d', [column[index] for _, index, _ in rows])
+            for field, column in table.columns.items()
+        }
+
+    def __len__(self):
+        return len(self.tank_ids)
+
+    def totals(self, indices=None):
+        r"""
+        Sum the stats and the battle-weighted expected values
+
+        :param indices: Positions of the tanks to sum. Every tank when
+                        omitted.
+        :return: Tuple of the actual totals, including ``tier``, and the
+                 expected totals, as taken by :func:`wn8`
+        """
+        battles = _take(self.stats['battles'], indices)
+        actual = {
+            field: sum(_take(column, indices))
+            for field, column in self.stats.items()
+        }
+        actual['tier'] = sum(map(mul, battles, _take(self.tiers, indices)))
+        expected = {
+            field: sum(map(mul, battles, _take(column, indices)))
+            for field, column in self.expected.items()
+        }
+        return actual, expected
+
+    def ratings(self, indices=None):
+        r"""
+        Rate some or all of the account's tanks together
+
+        :param indices: Positions of the tanks to rate. Every tank when
+                        omitted.
+        :return: Dictionary of ``Battles``, ``WN8``, ``WN7`` and ``Eff``
+        """
+        actual, expected = self.totals(indices)
+        return {
+            'Battles': int(actual['battles']),
+            'WN8': wn8(actual, expected),
+            'WN7': wn7(actual),
+            'Eff': efficiency(actual),
+        }
+
+    def by_tier(self):
+        r"""
+        Rate the tanks of each tier separately
+
+        :return: List of ``(tier, ratings)`` pairs, lowest tier first
+        """
+        tiers = {}
+        for index, tier in enumerate(self.tiers):
+            tiers.setdefault(tier, []).append(index)
+        return [
+            (tier, self.ratings(indices))
+            for tier, indices in sorted(tiers.items())
+        ]
@@ -0,0 +1,321 @@
+# Every reply template, compiled once at import. Templates are bound
+# str.format methods, so handlers call them directly with their data.
+
+# Longest reply that fits in a Reddit comment
+COMMENT_LIMIT = 10000
+# Opens every page of a reply after the first
+CONTINUED = '*(continued)*\n\n'
+
+PLAYER_SUMMARY = (
+    '##Name: {0[Name]}\n\n'
+    '|Stat|Career Average|\n'
+    ':--|:--\n'
+    'Eff|{0[Eff]}\n'
+    'WN7|{0[WN7]}\n'
+    'WN8|{0[WN8]}\n\n'
+).format
+PLAYER_RECENT = (
+    '##Name: {0[Name]}\n\n'
+    '|Stat|Week|Month|Overall|\n'
+    ':--|:--|:--|:--\n'
+).format
+PLAYER_EFFICIENCY = (
+    '##Name: {0[Name]}\n\n'
+    '|From|To|Efficiency|WN7|WN8|Battles|Wins|\n'
+    ':--|:--|:--|:--|:--|:--|:--\n'
+).format
+PLAYER_TANKS = {
+    'tanks efficiency': (
+        '##Name: {0[Name]}\n\n'
+        '|Tier|Mastery|Name|Type|Win rate|Wins|Battles|Avg Dmg|'
+        'Percent of all battles|Efficiency|WN8|\n'
+        ':--|:--|:--|:--|:--|:--|:--|:--|:--|:--|:--\n'
+    ).format,
+    'tanks top': (
+        '##Name: {0[Name]}\n\n'
+        '*Note: {0[Sort]}*\n\n'
+        '|Tier|Mastery|Name|Type|Win rate|Wins|Battles|Avg Dmg|'
+        'Percent of all battles|Efficiency|WN8|\n'
+        ':--|:--|:--|:--|:--|:--|:--|:--|:--|:--|:--\n'
+    ).format,
+}
+# Rows comparing several players, with the template of their cells
+PLAYER_COMPARE = (
+    ('Eff', '{0[Eff]}'.format),
+    ('WN7', '{0[WN7]}'.format),
+    ('WN8', '{0[WN8]}'.format),
+)
+PLAYER_PROGRESS = (
+    '##Name: {0}\n\n'
+    '*Compared with {1}*\n\n'
+    '|Stat|Then|Now|\n'
+    ':--|:--|:--\n'
+).format
+PLAYER_RATINGS = (
+    '##Name: {0}\n\n'
+    '*Rated over {1} of {2} tanks with expected values*\n\n'
+    '|Tier|Battles|WN8|WN7|Efficiency|\n'
+    ':--|:--|:--|:--|:--\n'
+).format
+RATING_ROW = (
+    '{0[0]}|{0[1][Battles]}|{0[1][WN8]:.0f}|{0[1][WN7]:.0f}|{0[1][Eff]:.0f}'
+).format
+# Rows of the career statistics from the Wargaming API, one column per player
+PLAYER_ACCOUNT = (
+    ('Battles', '{0[Battles]}'.format),
+    ('Win rate', '{0[WinRate]:.2%}'.format),
+    ('Average damage', '{0[Damage]:.0f}'.format),
+    ('Kills per battle', '{0[Frags]:.2f}'.format),
+    ('Spots per battle', '{0[Spots]:.2f}'.format),
+)
+RECENT_ROW = '{0[0]}|{0[1]}|{0[2]}|{0[3]}'.format
+PROGRESS_ROW = '{0[0]}|{0[1]}|{0[2]}'.format
+TREND_ROW = '{0[0]}|{0[1]}|{0[2]}|{0[3]}|{0[4]}|{0[5]}|{0[6]}'.format
+TANK_ROW = (
+    '{0[0]}|{0[1]}|{0[2]}|{0[3]}|{0[4]}|{0[5]}|{0[6]}|{0[7]}|{0[8]}|'
+    '{0[9]}|{0[10]}'
+).format
+
+# Everything a clan subcommand shows before its table of players
+CLAN_HEADS = {
+    'summary': (
+        '##Name: {0[Name]}\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'This month\'s battles|{0[MonthBattles]}\n'
+        'Total members|{0[Count]}\n'
+        'Active members|{0[Active]}\n'
+        'Percent of players active|{0[ActivePercent]:.3%}\n'
+        'Total WN8|{0[TotalWn8]}\n'
+        'Total win rate|{0[TotalWinRate]:.3%}\n\n'
+    ).format,
+    'active': (
+        '##Name: {0[Name]}\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'Active member count|{0[Active]}\n'
+        'Percent of players active|{0[ActivePercent]:.3%}\n'
+        'This month\'s battles|{0[MonthBattles]}\n'
+        'Win rate|{0[ActiveWinRate]:.3%}\n'
+        'WN8|{0[ActiveWn8]}\n'
+        'Average tier|{0[ActiveAvgTier]}\n\n'
+        '###Active players\n\n'
+        'Player | Months\'s battles\n'
+        ':-:|:-:'
+    ).format,
+    'battles': (
+        '##Name: {0[Name]}\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'Total battles|{0[TotalBattles]}\n'
+        'Total win rate|{0[TotalWinRate]:.3%}\n'
+        'This month\'s battles|{0[MonthBattles]}\n'
+        'This month\'s win rate|{0[MonthWinRate]}\n'
+        'Active player battles|{0[ActiveBattles]}\n'
+        'Top 15 player battles|{0[Top15Battles]}\n\n'
+    ).format,
+    'players': (
+        '##Name: {0[Name]}\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'Total members|{0[Count]}\n'
+        'Active members|{0[Active]}\n'
+        'Average member WN8|{0[MeanWn8]}\n'
+        'Median member WN8|{0[MedianWn8]}\n'
+        'Median active member\'s WN8 this month|{0[ActiveMedianWn8]}\n\n'
+        '###All clan members\n\n'
+        'Player | Total WN8 | Month\'s WN8\n'
+        ':-:|:-:|:-:'
+    ).format,
+    'tiers': (
+        '##Name: {0[Name]}\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'Total average tier|{0[TotalAvgTier]}\n'
+        'Active average tier|{0[ActiveAvgTier]}\n'
+        'Top 15 average tier|{0[Top15AvgTier]}\n\n'
+        'Player | Lifetime tier average | Month\'s tier average\n'
+        ':-:|:-:|:-:'
+    ).format,
+    'top': '##Name: {0[Name]}\n\n'.format,
+}
+# Rows comparing several clans, with the template of their cells
+CLAN_COMPARE = (
+    ('This month\'s battles', '{0[MonthBattles]}'.format),
+    ('Total members', '{0[Count]}'.format),
+    ('Active members', '{0[Active]}'.format),
+    ('Percent of players active', '{0[ActivePercent]:.3%}'.format),
+    ('Total WN8', '{0[TotalWn8]}'.format),
+    ('Total win rate', '{0[TotalWinRate]:.3%}'.format),
+)
+CLAN_ACTIVE_ROW = '{0[Name]} | {0[MonthBattles]}'.format
+CLAN_PLAYERS_ROW = '{0[Name]} | {0[TotalWn8]} | {0[MonthWn8]}'.format
+CLAN_TIERS_ROW = '{0[Name]} | {0[TotalTier]} | {0[MonthTier]}'.format
+CLAN_MONTH_ROW = '{0[Name]} | {0[MonthWn8]}'.format
+CLAN_TOTAL_ROW = '{0[Name]} | {0[TotalWn8]}'.format
+CLAN_BATTLES_ROW = '{0[Name]} | {0[MonthBattles]}'.format
+CLAN_TIER_ROW = '{0[Name]} | {0[TotalTier]}'.format
+CLAN_TOP_MONTH = (
+    '###Top {0} active players\n\n'
+    'Player | Month\'s WN8\n'
+    ':-:|:-:'
+).format
+CLAN_TOP_TOTAL = (
+    '\n\n\n'
+    '###Top {0} players overall\n\n'
+    'Player | Lifetime WN8\n'
+    ':-:|:-:'
+).format
+CLAN_TOP_FIELD = (
+    '###Top {0} players by {1}\n\n'
+    'Player | {2}\n'
+    ':-:|:-:'
+).format
+CLAN_GROWTH = (
+    '##Name: {0}\n\n'
+    '|Date|Members|Active members|This month\'s battles|Total WN8|\n'
+    ':--|:--|:--|:--|:--'
+).format
+GROWTH_ROW = '{0[0]}|{0[1]}|{0[2]}|{0[3]}|{0[4]}'.format
+
+TANK_INFO = {
+    'moe': (
+        '##Name: {0[Name]}\n\n'
+        '{0[TypeName]} tier {0[Tier]} tank ({0[NatioName]})\n\n'
+        'Mark | Average Damage\n'
+        ':-:|:-:\n'
+        '1|{0[Moe1Dmg]}\n'
+        '2|{0[Moe2Dmg]}\n'
+        '3|{0[Moe3Dmg]}\n\n'
+        'Source: {1}'
+    ).format,
+    'wn8': (
+        '##Name: {0[Name]}\n\n'
+        '{0[TypeName]} tier {0[Tier]} tank ({0[NatioName]})\n\n'
+        '*Note: These are the Expected Values, which reflect the 65^th '
+        'percentile of players! (Matching these gives a WN8 of 1565)*\n\n'
+        '|||\n'
+        ':--|:--\n'
+        'Damage|{0[Damage]}\n'
+        'Win rate|{0[WinRate]}\n'
+        'Kill ratio|{0[Frag]}\n'
+        'Spot ratio|{0[Spot]}\n'
+        'Defense ratio|{0[Def]}\n\n'
+        'Source: {1}'
+    ).format,
+}
+TANK_CHOICES = (
+    'Multiple tanks were returned for that name. This means there '
+    'is not an exact match. You can retry with one of the '
+    'following (assuming it contains what you want):\n\n'
+    '|Tank|\n'
+    '|:-:|'
+)
+TANK_CHOICE_ROW = '|{0[Name]}|'.format
+
+
+class MarkdownWriter(object):
+    r"""
+    Build a reply in a single buffer, keeping track of its length
+
+    Handlers may return a writer instead of a string. ``len()`` gives the
+    length of the reply without joining it, so it is known whether the reply
+    fits in a comment before any text is copied.
+
+    The end of every table row is remembered, so a reply that is too long
+    can be split into pages between rows, each repeating its table's header.
+
+    :param int limit: Longest reply that fits in a comment
+    """
+
+    def __init__(self, limit=COMMENT_LIMIT):
+        self.parts = []
+        self.length = 0
+        self.limit = limit
+        # Offsets a page may end at, with the text that opens the next page
+        self.breaks = []
+
+    def write(self, text):
+        r"""
+        Append text to the reply
+
+        :param str text: Text to append
+        :return: The writer, so calls can be chained
+        """
+        self.parts.append(text)
+        self.length += len(text)
+        return self
+
+    def rows(self, row, items, lead=False):
+        r"""
+        Append one table row per item, separated by newlines
+
+        :param row: Compiled row template, called with each item
+        :param items: Items to render
+        :param bool lead: Also put a newline before the first row, for tables
+                          whose header does not end with one
+        :return: The writer, so calls can be chained
+        """
+        # A table's header is the title and alignment lines written before it
+        header = '\n'.join(str(self).rstrip('\n').split('\n')[-2:])
+        if '--' not in header and ':-' not in header:
+            header = ''
+        first = len(self.breaks)
+        for item in items:
+            if lead:
+                self.write('\n')
+            self.write(row(item))
+            self.breaks.append((self.length, header))
+            lead = True
+        if len(self.breaks) > first:
+            # Whatever follows the last row is not part of the table
+            self.breaks[-1] = (self.length, '')
+        return self
+
+    def pages(self):
+        r"""
+        Split the reply into pages that each fit in a comment
+
+        Pages end between table rows where possible, then at the end of a
+        line, and as a last resort at the limit itself. Every page after the
+        first says it is continued and repeats the header of the table it
+        continues.
+
+        :return: List of page texts
+        """
+        text = str(self)
+        pages = []
+        start = 0
+        prefix = ''
+        breaks = iter(self.breaks)
+        upcoming = next(breaks, None)
+        while len(prefix) + len(text) - start > self.limit:
+            room = self.limit - len(prefix)
+            end, header = start + room, None
+            while upcoming is not None and upcoming[0] <= start + room:
+                if upcoming[0] > start:
+                    end, header = upcoming
+                upcoming = next(breaks, None)
+            if header is None:
+                line = text.rfind('\n', start, start + room)
+                if line > start:
+                    end = line
+                header = ''
+            pages.append(prefix + text[start:end])
+            start = end
+            prefix = CONTINUED + header
+            if len(prefix) >= self.limit // 2:
+                prefix = CONTINUED
+            if not header:
+                while text.startswith('\n', start):
+                    start += 1
+        pages.append(prefix + text[start:])
+        return pages
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        if len(self.parts) > 1:
+            self.parts = [''.join(self.parts)]
+        return self.parts[0] if self.parts else ''
@@ -0,0 +1,154 @@
+from array import array
+from heapq import nlargest
+from math import ceil
+from sys import intern
+
+# Per-player columns kept from a wotclans clan listing
+COLUMNS = ('MonthBattles', 'MonthWn8', 'MonthTier', 'TotalWn8', 'TotalTier')
+
+
+def _column(values):
+    # Whole numbers and decimals are packed into arrays, keeping their type so
+    # they render exactly as they came. Anything else (e.g. missing values) is
+    # kept as given.
+    if all(type(value) is int for value in values):
+        try:
+            return array('q', values)
+        except OverflowError:
+            return tuple(values)
+    if all(type(value) in (int, float) for value in values):
+        return array('d', values)
+    return tuple(values)
+
+
+class Roster(object):
+    r"""
+    The members of a clan, stored column by column
+
+    Names are interned and every numeric column is a packed ``array``, so a
+    roster takes a fraction of the memory of the decoded JSON and aggregates
+    scan a single column instead of a dictionary per player.
+
+    :param list players: Player dictionaries from the wotclans API
+    """
+
+    __slots__ = ('names', 'columns')
+
+    def __init__(self, players):
+        self.names = tuple(intern(player['Name']) for player in players)
+        self.columns = {
+            column: _column([player.get(column) for player in players])
+            for column in COLUMNS
+        }
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        return self.names, self.columns
+
+    def __setstate__(self, state):
+        self.names, self.columns = state
+
+    def active(self):
+        r"""
+        Indices of the players with battles this month, in roster order
+        """
+        return [
+            index for index, battles in enumerate(self.columns['MonthBattles'])
+            if battles
+        ]
+
+    def values(self, column, indices=None):
+        r"""
+        The known values of a column, skipping missing ones
+
+        :param str column: Column name
+        :param list indices: Players to include. All of them when omitted.
+        """
+        values = self.columns[column]
+        if indices is not None:
+            values = [values[index] for index in indices]
+        return [value for value in values if value is not None]
+
+    def mean(self, column, indices=None):
+        r"""
+        Average of a column, or ``None`` if no players are selected
+
+        :param str column: Column name
+        :param list indices: Players to average. All of them when omitted.
+        """
+        values = self.values(column, indices)
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+    def percentile(self, column, fraction, indices=None):
+        r"""
+        Value below which ``fraction`` of a column falls (nearest rank)
+
+        :param str column: Column name
+        :param float fraction: Between 0 and 1, e.g. 0.5 for the median
+        :param list indices: Players to consider. All of them when omitted.
+        :return: The value, or ``None`` if no players are selected
+        """
+        values = self.values(column, indices)
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[max(0, ceil(fraction * len(ordered)) - 1)]
+
+    def top(self, column, k):
+        r"""
+        Indices of the ``k`` players with the highest values, best first
+
+        Ties keep roster order.
+
+        :param str column: Column name
+        :param int k: Number of players to keep
+        """
+        return nlargest(k, range(len(self.names)),
+                        key=self.columns[column].__getitem__)
+
+    def records(self, indices=None):
+        r"""
+        Build a dictionary for each selected player, for the row templates
+
+        Only the rows being shown are ever built.
+
+        :param list indices: Players to include. All of them when omitted.
+        """
+        if indices is None:
+            indices = range(len(self.names))
+        columns = self.columns.items()
+        for index in indices:
+            record = {name: values[index] for name, values in columns}
+            record['Name'] = self.names[index]
+            yield record
+
+
+class Clan(object):
+    r"""
+    A parsed wotclans clan listing
+
+    Kept in the response cache next to the raw listing, so repeated lookups
+    skip decoding the JSON. It is only reused while it was built from the
+    cached response, i.e. their ``fetched`` times match.
+
+    :param dict data: Decoded clan listing
+    :param float fetched: When the listing was fetched
+    """
+
+    __slots__ = ('info', 'roster', 'fetched')
+
+    def __init__(self, data, fetched):
+        self.info = {
+            name: value for name, value in data.items() if name != 'Players'}
+        self.roster = Roster(data.get('Players') or ())
+        self.fetched = fetched
+
+    def __getstate__(self):
+        return self.info, self.roster, self.fetched
+
+    def __setstate__(self, state):
+        self.info, self.roster, self.fetched = state
@@ -0,0 +1,172 @@
+# Checks of the command parser: the requests it resolves mentions to and the
+# replies it gives to malformed ones.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import dispatch  # noqa: E402
+from dispatch import Command, PS, Request, Subcommand, XBOX  # noqa: E402
+
+
+def handler(request, session):
+    pass
+
+
+def batch(request, session):
+    pass
+
+
+def thanks(request, session):
+    pass
+
+
+COMMANDS = {
+    'help': Command(handler),
+    'player': Command(subcommands={
+        'summary': Subcommand(handler, batch=batch),
+        'recent': Subcommand(handler),
+        'progress': Subcommand(handler, days=7),
+        'tanks top': Subcommand(handler, 10, {'battles': 0, 'wn8': 0}),
+    }),
+    'clan': Command(
+        subcommands={'summary': Subcommand(handler)},
+        missing='No clan name entered.',
+        invalid='Invalid clan command. Try one of: {1}',
+        words=1),
+}
+RESPONSES = {'good': thanks}
+
+
+def resolve(text):
+    return dispatch.resolve(text.lower().split(), COMMANDS, RESPONSES)
+
+
+class RequestTest(unittest.TestCase):
+
+    def test_bare_mention_gets_the_default(self):
+        request = resolve('/u/wotc_bot')
+        self.assertIsInstance(request, Request)
+        self.assertEqual((request.bot, request.command), ('wotc_bot', 'help'))
+
+    def test_responses_to_other_messages(self):
+        self.assertIs(resolve('good bot').handler, thanks)
+        self.assertIsNone(resolve('nice bot'))
+        self.assertIsNone(resolve(''))
+
+    def test_single_name(self):
+        request = resolve('/u/wotc_bot player ps4 recent Some Player')
+        self.assertIs(request.handler, handler)
+        self.assertEqual(request.platform, PS)
+        self.assertEqual(request.subcommand, 'recent')
+        self.assertEqual(request.name, 'some player')
+        self.assertEqual(request.names, ('some player',))
+        self.assertIsNone(request.count)
+
+    def test_two_word_subcommand(self):
+        request = resolve('/u/wotc_bot player xbox tanks top alpha')
+        self.assertEqual(request.subcommand, 'tanks top')
+        self.assertEqual(request.platform, XBOX)
+        self.assertEqual((request.count, request.field), (10, None))
+
+    def test_words_per_name(self):
+        request = resolve('/u/wotc_bot clan ps summary rddt extra words')
+        self.assertEqual(request.name, 'rddt')
+
+
+class OptionsTest(unittest.TestCase):
+
+    def test_count_and_field(self):
+        request = resolve('/u/wotc_bot player ps tanks top 5 by wn8 alpha')
+        self.assertEqual((request.count, request.field), (5, 'wn8'))
+        self.assertEqual(request.name, 'alpha')
+
+    def test_count_is_limited(self):
+        request = resolve('/u/wotc_bot player ps tanks top 999 alpha')
+        self.assertEqual(request.count, dispatch.TOP_LIMIT)
+        request = resolve('/u/wotc_bot player ps tanks top 0 alpha')
+        self.assertEqual(request.count, 1)
+
+    def test_number_alone_is_a_name(self):
+        request = resolve('/u/wotc_bot player ps tanks top 5')
+        self.assertEqual((request.count, request.name), (10, '5'))
+
+    def test_days(self):
+        request = resolve('/u/wotc_bot player ps progress 30 alpha')
+        self.assertEqual((request.count, request.name), (30, 'alpha'))
+        request = resolve('/u/wotc_bot player ps progress alpha')
+        self.assertEqual(request.count, 7)
+        request = resolve('/u/wotc_bot player ps progress 9999 alpha')
+        self.assertEqual(request.count, dispatch.DAYS_LIMIT)
+
+    def test_days_take_no_field(self):
+        request = resolve('/u/wotc_bot player ps progress by wn8 alpha')
+        self.assertEqual(request.name, 'by wn8 alpha')
+        self.assertIsNone(request.field)
+
+
+class ErrorTest(unittest.TestCase):
+
+    def test_unknown_command(self):
+        self.assertEqual(
+            resolve('/u/wotc_bot dance'), dispatch.UNKNOWN.format('wotc_bot'))
+
+    def test_bad_platform(self):
+        self.assertEqual(
+            resolve('/u/wotc_bot player pc recent alpha'),
+            dispatch.BAD_PLATFORM)
+
+    def test_missing_arguments(self):
+        self.assertEqual(resolve('/u/wotc_bot player'), dispatch.MISSING)
+        self.assertEqual(resolve('/u/wotc_bot player ps'), dispatch.MISSING)
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps recent'), dispatch.MISSING)
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps tanks'), dispatch.MISSING)
+        self.assertEqual(
+            resolve('/u/wotc_bot clan ps summary'), 'No clan name entered.')
+
+    def test_bad_subcommand(self):
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps dance alpha'),
+            dispatch.BAD_SUBCOMMAND.format('dance'))
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps tanks dance alpha'),
+            dispatch.BAD_SUBCOMMAND.format('dance'))
+        self.assertEqual(
+            resolve('/u/wotc_bot clan ps dance rddt'),
+            'Invalid clan command. Try one of: summary')
+
+    def test_bad_field(self):
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps tanks top by damage alpha'),
+            dispatch.BAD_FIELD.format('damage', 'battles, wn8'))
+
+    def test_batch(self):
+        request = resolve('/u/wotc_bot player ps summary alpha, beta,alpha')
+        self.assertIs(request.handler, batch)
+        self.assertEqual(request.names, ('alpha', 'beta'))
+        self.assertEqual(request.name, 'alpha')
+
+    def test_batch_needs_a_batch_handler(self):
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps recent alpha,beta'),
+            dispatch.BAD_BATCH.format('player summary'))
+
+    def test_batch_limit(self):
+        names = ','.join(
+            'p{}'.format(i) for i in range(dispatch.BATCH_LIMIT + 1))
+        self.assertEqual(
+            resolve('/u/wotc_bot player ps summary ' + names),
+            dispatch.TOO_MANY.format(dispatch.BATCH_LIMIT))
+        names = ','.join('p{}'.format(i) for i in range(dispatch.BATCH_LIMIT))
+        self.assertEqual(
+            len(resolve('/u/wotc_bot player ps summary ' + names).names),
+            dispatch.BATCH_LIMIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# Checks of the journal of answered mentions and of finishing a reply chain
+# that an earlier run broke off.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import bot  # noqa: E402
+from journal import Journal  # noqa: E402
+
+PAGES = ['first page', 'second page', 'third page']
+
+
+class Comment(object):
+    r"""
+    Stand-in for a praw comment or inbox message, recording every reply
+    """
+
+    def __init__(self, id, thread, fail=None):
+        self.id = id
+        self.thread = thread
+        self.fail = fail
+        self.read = False
+
+    def reply(self, text):
+        if text == self.fail:
+            raise IOError('Reddit is down')
+        comment = Comment('c{}'.format(len(self.thread.posted) + 1),
+                          self.thread, self.fail)
+        self.thread.posted.append((self.id, text))
+        self.thread.comments[comment.id] = comment
+        return comment
+
+    def mark_read(self):
+        self.read = True
+
+
+class Reddit(object):
+    r"""
+    Stand-in for ``praw.Reddit``, holding every comment posted
+    """
+
+    def __init__(self):
+        self.posted = []
+        self.comments = {}
+
+    def comment(self, id):
+        return self.comments[id]
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = Journal(':memory:')
+
+    def tearDown(self):
+        self.journal.close()
+
+    def test_unknown_message(self):
+        self.assertIsNone(self.journal.get('m1'))
+
+    def test_rendered_reply(self):
+        self.journal.rendered('m1', PAGES)
+        self.assertEqual(self.journal.get('m1'), (False, PAGES, 0, None))
+
+    def test_reply_needing_no_comment(self):
+        self.journal.rendered('m1', None)
+        self.assertEqual(self.journal.get('m1'), (False, None, 0, None))
+
+    def test_posted_pages(self):
+        self.journal.rendered('m1', PAGES)
+        self.journal.posted('m1', 1, 'c1')
+        self.journal.posted('m1', 2, 'c2')
+        self.assertEqual(self.journal.get('m1'), (False, PAGES, 2, 'c2'))
+        self.journal.replied('m1')
+        self.assertEqual(self.journal.get('m1'), (True, PAGES, 2, 'c2'))
+
+    def test_rendering_again_starts_over(self):
+        self.journal.rendered('m1', PAGES)
+        self.journal.posted('m1', 1, 'c1')
+        self.journal.rendered('m1', PAGES[:1])
+        self.assertEqual(self.journal.get('m1'), (False, PAGES[:1], 0, None))
+
+    def test_prune(self):
+        self.journal.rendered('m1', PAGES)
+        self.journal.keep = -1
+        self.journal.prune()
+        self.assertIsNone(self.journal.get('m1'))
+
+
+class RecallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = Journal(':memory:')
+        self.praw = ThreadPoolExecutor(max_workers=1)
+        self.reddit = Reddit()
+
+    def tearDown(self):
+        self.praw.shutdown()
+        self.journal.close()
+
+    def recall(self, message):
+        return asyncio.run(
+            bot.recall(message, self.reddit, self.praw, self.journal))
+
+    def respond(self, message, pages):
+        asyncio.run(bot.respond(message, pages, self.praw, self.journal))
+
+    def test_unknown_message_is_answered(self):
+        message = Comment('m1', self.reddit)
+        self.assertFalse(self.recall(message))
+        self.assertFalse(message.read)
+
+    def test_broken_chain_is_finished(self):
+        message = Comment('m1', self.reddit, fail='second page')
+        self.journal.rendered(message.id, PAGES)
+        with self.assertRaises(IOError):
+            self.respond(message, PAGES)
+        self.assertEqual(self.journal.get('m1'), (False, PAGES, 1, 'c1'))
+        # The next run resumes below the last page posted
+        self.reddit.comments['c1'].fail = None
+        self.assertTrue(self.recall(Comment('m1', self.reddit)))
+        self.assertEqual(self.reddit.posted, [
+            ('m1', 'first page'), ('c1', 'second page'),
+            ('c2', 'third page')])
+        self.assertEqual(self.journal.get('m1'), (True, PAGES, 3, 'c3'))
+
+    def test_answered_message_is_only_marked_read(self):
+        message = Comment('m1', self.reddit)
+        self.journal.rendered(message.id, PAGES)
+        self.respond(message, PAGES)
+        self.journal.replied(message.id)
+        self.assertTrue(self.recall(message))
+        self.assertTrue(message.read)
+        self.assertEqual(len(self.reddit.posted), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
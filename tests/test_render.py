@@ -0,0 +1,77 @@
+# Checks of the reply buffer and how long replies are split into comments.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+from render import CONTINUED, MarkdownWriter  # noqa: E402
+
+HEADER = 'Name|WN8\n:--|:--'
+ROW = '{0[0]}|{0[1]}'.format
+
+
+def table(limit, count, lead=True):
+    out = MarkdownWriter(limit).write('##Players\n\n' + HEADER)
+    out.rows(ROW, [('player{}'.format(i), 1000 + i) for i in range(count)],
+             lead=lead)
+    return out.write('\n\nSource: example')
+
+
+class PagesTest(unittest.TestCase):
+
+    def test_short_reply_is_one_page(self):
+        out = table(10000, 3)
+        self.assertEqual(out.pages(), [str(out)])
+
+    def test_pages_fit_the_limit(self):
+        pages = table(120, 30).pages()
+        self.assertGreater(len(pages), 2)
+        for page in pages:
+            self.assertLessEqual(len(page), 120)
+
+    def test_pages_end_between_rows(self):
+        out = table(120, 30)
+        pages = out.pages()
+        rows = [ROW(('player{}'.format(i), 1000 + i)) for i in range(30)]
+        found = []
+        for page in pages:
+            for line in page.split('\n'):
+                if line.startswith('player'):
+                    found.append(line)
+        self.assertEqual(found, rows)
+        self.assertTrue(pages[0].startswith('##Players\n\n' + HEADER + '\n'))
+        self.assertTrue(pages[-1].endswith('\n\nSource: example'))
+
+    def test_header_is_repeated(self):
+        for page in table(120, 30).pages()[1:]:
+            self.assertTrue(page.startswith(CONTINUED + HEADER + '\nplayer'))
+
+    def test_text_after_the_table_has_no_header(self):
+        out = MarkdownWriter(60).write(HEADER)
+        out.rows(ROW, [('a', 1), ('b', 2)], lead=True)
+        out.write('\n\n' + 'word ' * 5 + '\n' + 'more ' * 8)
+        pages = out.pages()
+        self.assertEqual(pages, [
+            HEADER + '\na|1\nb|2', CONTINUED + 'word ' * 5,
+            CONTINUED + 'more ' * 8])
+
+    def test_text_without_breaks_is_cut_at_lines(self):
+        text = '\n'.join('line {}'.format(i) for i in range(40))
+        pages = MarkdownWriter(100).write(text).pages()
+        for page in pages:
+            self.assertLessEqual(len(page), 100)
+        self.assertEqual(
+            '\n'.join(page[len(CONTINUED):] if i else page
+                      for i, page in enumerate(pages)),
+            text)
+
+    def test_length_without_joining(self):
+        out = table(10000, 5)
+        self.assertEqual(len(out), len(str(out)))
+
+
+if __name__ == '__main__':
+    unittest.main()
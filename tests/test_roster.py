@@ -0,0 +1,76 @@
+# Checks of the clan roster column store and the clan summaries built from its
+# aggregates.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+import bot  # noqa: E402
+from render import CLAN_HEADS  # noqa: E402
+from roster import Clan, Roster  # noqa: E402
+
+
+def player(name, total, month=None, battles=0):
+    return {
+        'Name': name, 'TotalWn8': total, 'MonthWn8': month,
+        'MonthBattles': battles, 'MonthTier': 8.0, 'TotalTier': 7.5}
+
+
+class RosterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.roster = Roster([
+            player('alpha', 4), player('beta', 1, 900, 12),
+            player('gamma', 3, 1100, 3), player('delta', 2),
+            player('epsilon', None)])
+
+    def test_missing_values_are_skipped(self):
+        self.assertEqual(self.roster.values('TotalWn8'), [4, 1, 3, 2])
+        self.assertEqual(self.roster.mean('TotalWn8'), 2.5)
+
+    def test_nearest_rank_percentiles(self):
+        # The median of 1, 2, 3 and 4 is the second value
+        self.assertEqual(self.roster.percentile('TotalWn8', 0.5), 2)
+        self.assertEqual(self.roster.percentile('TotalWn8', 0), 1)
+        self.assertEqual(self.roster.percentile('TotalWn8', 0.75), 3)
+        self.assertEqual(self.roster.percentile('TotalWn8', 1), 4)
+        self.assertEqual(
+            self.roster.percentile('TotalWn8', 0.5, [0, 2, 3]), 3)
+
+    def test_active_players(self):
+        self.assertEqual(self.roster.active(), [1, 2])
+        self.assertEqual(
+            self.roster.percentile('MonthWn8', 0.5, self.roster.active()),
+            900)
+
+    def test_nobody_selected(self):
+        self.assertIsNone(self.roster.mean('TotalWn8', []))
+        self.assertIsNone(self.roster.percentile('TotalWn8', 0.5, []))
+
+
+class ClanPlayersTest(unittest.TestCase):
+
+    def test_member_wn8_rows(self):
+        clan = Clan({
+            'Name': 'Test Clan', 'Count': 4, 'Active': 2,
+            'Players': [
+                player('alpha', 1000), player('beta', 1500, 1800, 20),
+                player('gamma', 2000, 1200, 5), player('delta', 1200)]},
+            None)
+        head = CLAN_HEADS['players'](bot.clan_stats(clan))
+        self.assertIn('Average member WN8|1425\n', head)
+        self.assertIn('Median member WN8|1200\n', head)
+        self.assertIn(
+            'Median active member\'s WN8 this month|1200\n', head)
+
+    def test_empty_roster(self):
+        clan = Clan({'Name': 'Empty', 'Count': 0, 'Active': 0}, None)
+        head = CLAN_HEADS['players'](bot.clan_stats(clan))
+        self.assertIn('Median member WN8|n/a\n', head)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+# Checks of the Wargaming API client, the ratings worked out from its per-tank
+# stats and the replies built on both, run against the local mock in
+# benchmarks/wgapi.py.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import asyncio
+from collections import Counter
+import os
+import sys
+from threading import Thread
+import unittest
+from unittest import mock
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'benchmarks'))
+import bot  # noqa: E402
+import ratings  # noqa: E402
+from cache import CachedResponse, ResponseCache  # noqa: E402
+from catalog import TankCatalog  # noqa: E402
+from standin import Mention  # noqa: E402
+from wargaming import TANK_FIELDS, WargamingAPI, WargamingError  # noqa: E402
+import wgapi  # noqa: E402
+
+SERVER = None
+
+
+def setUpModule():
+    global SERVER
+    SERVER = wgapi.serve()
+    Thread(target=SERVER.serve_forever, daemon=True).start()
+
+
+def tearDownModule():
+    SERVER.shutdown()
+    SERVER.server_close()
+
+
+class MockSession(object):
+    r"""
+    Coroutine transport sending every request to the mock API
+
+    A request for ``https://<host>/<path>`` goes to
+    ``http://127.0.0.1:PORT/<host>/<path>``, as with
+    :class:`standin.ReplayTransport`, and responses with a key are cached.
+    Requests are counted by API method.
+    """
+
+    def __init__(self):
+        self.base = 'http://127.0.0.1:{}'.format(SERVER.server_address[1])
+        self.cache = ResponseCache()
+        self.calls = Counter()
+
+    def fetch(self, url):
+        with urlopen(url) as r:
+            return CachedResponse(r.status, r.read(), url)
+
+    async def get(self, url, params=None, key=None):
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        parts = urlsplit(url)
+        self.calls[parts.path.split('/wotx/')[-1].strip('/')] += 1
+        local = '{}/{}{}?{}'.format(
+            self.base, parts.netloc, parts.path, urlencode(params or {}))
+        r = await asyncio.get_running_loop().run_in_executor(
+            None, self.fetch, local)
+        if key is not None and r.status_code == 200:
+            self.cache.set(key, r)
+        return r
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AccountIdsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = WargamingAPI('test')
+        self.session = MockSession()
+
+    def test_batches_of_one_hundred(self):
+        names = ['player{}'.format(i) for i in range(250)]
+        found = run(self.api.account_ids(self.session, 'xbox', names))
+        self.assertEqual(self.session.calls['account/list'], 3)
+        self.assertEqual(len(found), 250)
+        self.assertEqual(found['player7'], wgapi.account_id('player7'))
+
+    def test_missing_names_are_left_out(self):
+        found = run(self.api.account_ids(
+            self.session, 'ps', ['alpha', 'missingbeta', 'Gamma']))
+        self.assertEqual(set(found), {'alpha', 'Gamma'})
+
+    def test_known_names_come_from_the_cache(self):
+        run(self.api.account_ids(self.session, 'xbox', ['alpha', 'beta']))
+        found = run(self.api.account_ids(
+            self.session, 'xbox', ['beta', 'alpha']))
+        self.assertEqual(self.session.calls['account/list'], 1)
+        self.assertEqual(found['beta'], wgapi.account_id('beta'))
+
+    def test_error_answers_raise(self):
+        self.api.application_id = ''
+        with self.assertRaises(WargamingError):
+            run(self.api.account_ids(self.session, 'xbox', ['alpha']))
+
+
+class AccountsTest(unittest.TestCase):
+
+    def test_batches_of_one_hundred(self):
+        session = MockSession()
+        ids = list(range(1000, 1150))
+        found = run(WargamingAPI('test').accounts(
+            session, 'xbox', ids, fields='statistics.all'))
+        self.assertEqual(session.calls['account/info'], 2)
+        self.assertEqual(sorted(found), ids)
+        self.assertEqual(
+            found[1000]['statistics']['all']['battles'],
+            wgapi.account(1000)['statistics']['all']['battles'])
+
+
+class TankStatsTest(unittest.TestCase):
+
+    def test_every_vehicle_in_one_request(self):
+        session = MockSession()
+        api = WargamingAPI('test')
+        tanks = run(api.tank_stats(session, 'ps', 12345))
+        self.assertEqual(tanks, wgapi.tanks(12345))
+        self.assertEqual(session.calls['tanks/stats'], 1)
+        for field in TANK_FIELDS:
+            if field.startswith('all.'):
+                self.assertIn(field[4:], tanks[0]['all'])
+        run(api.tank_stats(session, 'ps', 12345))
+        self.assertEqual(session.calls['tanks/stats'], 1)
+
+
+class RatingsTest(unittest.TestCase):
+
+    def totals(self, battles, tier, **averages):
+        actual = {field: 0 for field in ratings.STATS}
+        actual.update(
+            {field: value * battles for field, value in averages.items()},
+            battles=battles, tier=tier * battles)
+        return actual
+
+    def test_wn8_of_the_expected_values(self):
+        # Matching every expected value exactly gives a WN8 of 1565
+        actual = self.totals(
+            100, 8, damage_dealt=1500, spotted=1.2, frags=0.9,
+            dropped_capture_points=0.6, wins=0.52)
+        expected = {
+            'Damage': 150000, 'Spot': 120, 'Frag': 90, 'Def': 60,
+            'WinRate': 52}
+        self.assertAlmostEqual(ratings.wn8(actual, expected), 1565)
+
+    def test_wn8_without_battles(self):
+        actual = self.totals(0, 0)
+        expected = dict.fromkeys(ratings.EXPECTED, 0)
+        self.assertEqual(ratings.wn8(actual, expected), 0)
+
+    def test_wn7(self):
+        actual = self.totals(
+            100, 6, damage_dealt=1000, frags=1, spotted=1,
+            dropped_capture_points=1, wins=0.5)
+        self.assertAlmostEqual(ratings.wn7(actual), 1323.2506, places=3)
+
+    def test_efficiency(self):
+        # 500 * 10 / 7 * 0.33 + 250 + 150 + 150, with no capture points
+        actual = self.totals(
+            1, 5, damage_dealt=500, frags=1, spotted=1,
+            dropped_capture_points=1)
+        self.assertAlmostEqual(ratings.efficiency(actual), 1650 / 7 + 550)
+
+    def test_tiers_are_rated_separately(self):
+        table = ratings.ExpectedValues([
+            {'TankId': 1, 'Tier': 5, 'Damage': 500, 'Spot': 1, 'Frag': 1,
+             'Def': 1, 'WinRate': 50},
+            {'TankId': 2, 'Tier': 8, 'Damage': 1500, 'Spot': 1, 'Frag': 1,
+             'Def': 1, 'WinRate': 0.5},
+            {'TankId': 3, 'Tier': 8}])
+        self.assertEqual(len(table), 2)
+        played = [
+            {'tank_id': 1, 'all': {
+                'battles': 10, 'wins': 5, 'damage_dealt': 5000,
+                'frags': 10, 'spotted': 10, 'dropped_capture_points': 10}},
+            {'tank_id': 2, 'all': {
+                'battles': 30, 'wins': 15, 'damage_dealt': 45000,
+                'frags': 30, 'spotted': 30, 'dropped_capture_points': 30}},
+            {'tank_id': 3, 'all': {'battles': 5}},
+            {'tank_id': 4, 'all': {'battles': 0}}]
+        rated = table.rate(played)
+        self.assertEqual(len(rated), 2)
+        tiers = rated.by_tier()
+        self.assertEqual([tier for tier, _ in tiers], [5, 8])
+        self.assertEqual(
+            [stats['Battles'] for _, stats in tiers], [10, 30])
+        for _, stats in tiers + [(None, rated.ratings())]:
+            self.assertAlmostEqual(stats['WN8'], 1565)
+
+
+class RepliesTest(unittest.TestCase):
+
+    def setUp(self):
+        # Every tank of the mock, with the same expected values
+        catalog = TankCatalog([
+            {'TankId': tank, 'Name': 'Tank {}'.format(tank),
+             'Tier': 1 + index % 10, 'Damage': 1500.0, 'Spot': 1.2,
+             'Frag': 0.9, 'Def': 0.6, 'WinRate': 52.0}
+            for index, tank in enumerate(wgapi.TANK_IDS)])
+        for patch in (
+                mock.patch.object(bot._WARGAMING_, 'application_id', 'test'),
+                mock.patch.dict(bot._CATALOGS_.catalogs, xbox=catalog)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.session = MockSession()
+
+    def test_stats_compares_players(self):
+        reply = str(bot.parse(
+            Mention('/u/wotc_bot player xbox stats alpha,missingbeta'),
+            self.session))
+        battles = wgapi.account(wgapi.account_id('alpha'))[
+            'statistics']['all']['battles']
+        self.assertIn('Battles|{}|n/a'.format(battles), reply)
+        self.assertIn('*No data could be found for: missingbeta*', reply)
+        self.assertEqual(self.session.calls['account/list'], 1)
+        self.assertEqual(self.session.calls['account/info'], 1)
+
+    def test_ratings_by_tier(self):
+        reply = str(bot.parse(
+            Mention('/u/wotc_bot player xbox ratings alpha'), self.session))
+        self.assertIn('*Rated over 20 of 20 tanks', reply)
+        self.assertIn('|Tier|Battles|WN8|WN7|Efficiency|', reply)
+        battles = sum(
+            tank['all']['battles']
+            for tank in wgapi.tanks(wgapi.account_id('alpha')))
+        self.assertIn('\nAll|{}|'.format(battles), reply)
+
+    def test_ratings_of_unknown_player(self):
+        reply = bot.parse(
+            Mention('/u/wotc_bot player xbox ratings missingalpha'),
+            self.session)
+        self.assertEqual(
+            reply, 'I could not find any tank statistics for missingalpha.')
+
+
+if __name__ == '__main__':
+    unittest.main()
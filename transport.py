@@ -0,0 +1,450 @@
+from contextvars import ContextVar
+from threading import Event, Lock
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+
+from cache import CachedResponse
+from metrics import METRICS
+
+# Fetch times of the stale responses served to the request being answered.
+# Set to a list by whoever wants to know, e.g. to add a "data as of" note.
+SERVED_STALE = ContextVar('served_stale', default=None)
+
+
+class UpstreamDown(IOError):
+    r"""
+    Raised instead of sending a request to a host whose circuit is open
+
+    :param str host: Host that is not being contacted
+    """
+
+    def __init__(self, host):
+        super(UpstreamDown, self).__init__(
+            '{} is not responding, not retrying yet'.format(host))
+        self.host = host
+
+
+class TokenBucket(object):
+    r"""
+    Token bucket rate limiter
+
+    :param float rate: Tokens added per second
+    :param int burst: Most tokens the bucket can hold
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def reserve(self):
+        r"""
+        Take a token if one is available
+
+        :return: 0 if a token was taken, otherwise the seconds to wait before
+                 trying again
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        r"""
+        Take a token, sleeping until one is available
+        """
+        delay = self.reserve()
+        while delay:
+            sleep(delay)
+            delay = self.reserve()
+
+
+class RateLimits(object):
+    r"""
+    A :class:`TokenBucket` per host
+
+    :param float rate: Requests per second allowed to each host. No limit is
+                       applied when 0.
+    :param int burst: Requests a host may receive at once before ``rate``
+                      applies
+    """
+
+    def __init__(self, rate=0, burst=10):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = Lock()
+
+    def bucket(self, url):
+        r"""
+        Return the bucket of the host serving ``url``, or ``None`` if
+        requests are not limited
+
+        :param str url: URL about to be requested
+        """
+        if not self.rate:
+            return None
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(
+                    self.rate, self.burst)
+        return bucket
+
+
+class CircuitBreaker(object):
+    r"""
+    Stop sending requests to a host that keeps failing
+
+    After ``failures`` failed requests in a row the circuit opens and
+    requests fail at once for ``cooldown`` seconds. A single request is then
+    let through while the others wait another ``cooldown``: the circuit
+    closes if it succeeds and stays open if it fails.
+
+    :param int failures: Failed requests in a row that open the circuit.
+                         The circuit never opens when 0.
+    :param float cooldown: Seconds the circuit stays open
+    """
+
+    def __init__(self, failures, cooldown):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.failed = 0
+        self.opened = None
+        self.lock = Lock()
+
+    def allow(self):
+        r"""
+        Whether a request may be sent now
+        """
+        with self.lock:
+            if self.opened is None:
+                return True
+            now = monotonic()
+            if now - self.opened < self.cooldown:
+                return False
+            # Let this request try the host and hold the rest back
+            self.opened = now
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failed = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.failed += 1
+            if self.opened is not None or \
+                    self.failures and self.failed >= self.failures:
+                self.opened = monotonic()
+
+
+class Breakers(object):
+    r"""
+    A :class:`CircuitBreaker` per host
+
+    :param int failures: Failed requests in a row that open a host's circuit.
+                         Circuits never open when 0.
+    :param float cooldown: Seconds a host's circuit stays open
+    """
+
+    def __init__(self, failures=5, cooldown=60):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.breakers = {}
+        self.lock = Lock()
+
+    def breaker(self, url):
+        r"""
+        Return the breaker of the host serving ``url``
+
+        :param str url: URL about to be requested
+        """
+        host = urlsplit(url).netloc
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(
+                    self.failures, self.cooldown)
+        return breaker
+
+
+def served_stale(fetched):
+    r"""
+    Note that the request being answered used data fetched at ``fetched``
+    because its upstream could not be reached
+
+    :param float fetched: When the data was fetched
+    """
+    served = SERVED_STALE.get()
+    if served is not None:
+        served.append(fetched)
+
+
+def last_good(cache, key):
+    r"""
+    Return the last successful response cached under ``key``, even if it has
+    expired, marked as stale
+
+    The response's fetch time is added to :data:`SERVED_STALE`.
+
+    :param cache: :class:`cache.ResponseCache`, or ``None``
+    :param tuple key: Cache key, or ``None``
+    :return: :class:`cache.CachedResponse`, or ``None`` if there is none
+    """
+    if key is None or cache is None:
+        return None
+    r = cache.stale(key)
+    if not isinstance(r, CachedResponse):
+        return None
+    served_stale(r.fetched)
+    return CachedResponse(r.status_code, r.content, r.url, r.fetched, True)
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    r"""
+    Share one in-flight call between all callers asking for the same key
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        r"""
+        Call ``function`` unless a call for ``key`` is already running, in
+        which case wait for it and return (or raise) its outcome instead
+
+        :param key: Hashable identifier of the call
+        :param function: Function to call
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+def settings(section):
+    r"""
+    Read the connection settings shared by every transport
+
+    :param section: ``ConfigParser`` section holding the pool settings
+    :return: Keyword arguments for :class:`Transport`
+    """
+    return {
+        'pool_connections': section.getint('Pool Connections', fallback=4),
+        'pool_maxsize': section.getint('Pool Size', fallback=8),
+        'timeout': section.getfloat('Timeout', fallback=10.0),
+        'connect_timeout': section.getfloat('Connect Timeout', fallback=3.0),
+        'retries': section.getint('Retries', fallback=2),
+        'backoff': section.getfloat('Backoff', fallback=0.5),
+        'rate': section.getfloat('Rate Limit', fallback=0),
+        'burst': section.getint('Rate Burst', fallback=10),
+        'failures': section.getint('Breaker Failures', fallback=5),
+        'cooldown': section.getfloat('Breaker Cooldown', fallback=60),
+    }
+
+
+class Transport(object):
+    r"""
+    Shared HTTP client for every upstream the bot talks to
+
+    A single :class:`requests.Session` keeps a keep-alive connection pool per
+    host, so consecutive requests to wotinfo.net or wotclans.com.br reuse the
+    same TCP/TLS connection instead of paying a fresh handshake.
+
+    Each host has a circuit breaker. While a host's circuit is open, or when
+    it fails, keyed lookups are answered with the last good response in the
+    cache (marked stale) and requests without one fail at once with
+    :class:`UpstreamDown`.
+
+    :param int pool_connections: Number of per-host pools to keep around
+    :param int pool_maxsize: Connections kept alive in each host's pool
+    :param float timeout: Seconds to wait for a response
+    :param float connect_timeout: Seconds to wait for a connection
+    :param int retries: Attempts made on connection errors and 5xx replies
+    :param float backoff: Backoff factor applied between retries
+    :param cache: Optional :class:`cache.ResponseCache` for keyed lookups
+    :param float rate: Requests per second allowed to each host. No limit is
+                       applied when 0.
+    :param int burst: Requests a host may receive at once before ``rate``
+                      applies
+    :param int failures: Failed requests in a row that open a host's circuit.
+                         Circuits never open when 0.
+    :param float cooldown: Seconds a host's circuit stays open
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=8, timeout=10.0,
+                 retries=2, backoff=0.5, cache=None, rate=0, burst=10,
+                 connect_timeout=3.0, failures=5, cooldown=60):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.cache = cache
+        self.limits = RateLimits(rate, burst)
+        self.breakers = Breakers(failures, cooldown)
+        self.flights = SingleFlight()
+        self.session = None
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, section, cache=None):
+        r"""
+        Build a transport from a configuration section
+
+        :param section: ``ConfigParser`` section holding the pool settings
+        :param cache: Optional :class:`cache.ResponseCache` to read through
+        """
+        return cls(cache=cache, **settings(section))
+
+    def throttle(self, url):
+        r"""
+        Wait until the host serving ``url`` may receive another request
+
+        :param str url: URL about to be requested
+        """
+        bucket = self.limits.bucket(url)
+        if bucket is not None:
+            bucket.acquire()
+
+    def get(self, url, params=None, key=None, **kwargs):
+        r"""
+        Issue a GET request, answering from the cache when possible
+
+        Only successful responses are cached, so errors are always retried on
+        the next request. Concurrent requests for the same key share a single
+        upstream request. Time spent waiting on the upstream is recorded as the
+        ``fetch`` stage, labelled with its host.
+
+        :param str url: URL to fetch
+        :param dict params: Query string parameters
+        :param tuple key: Cache key built with :func:`cache.cache_key`. When
+                          omitted the request always goes upstream.
+        """
+        if key is not None and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        with METRICS.timer('fetch', host=urlsplit(url).netloc):
+            try:
+                if key is None:
+                    r = self.fetch(url, params, key, **kwargs)
+                else:
+                    r = self.flights.do(
+                        key, self.fetch, url, params, key, **kwargs)
+            except IOError:
+                stale = last_good(self.cache, key)
+                if stale is None:
+                    raise
+                return stale
+        if r.status_code >= 500:
+            return last_good(self.cache, key) or r
+        return r
+
+    def refresh(self, url, params=None, key=None, **kwargs):
+        r"""
+        Fetch ``url`` even if the cache holds it, replacing the cached entry
+
+        Used to warm the cache ahead of demand. The time taken is recorded as
+        the ``prefetch`` stage rather than ``fetch``.
+
+        :param str url: URL to fetch
+        :param dict params: Query string parameters
+        :param tuple key: Cache key built with :func:`cache.cache_key`
+        """
+        with METRICS.timer('prefetch', host=urlsplit(url).netloc):
+            if key is None:
+                return self.fetch(url, params, key, **kwargs)
+            return self.flights.do(
+                key, self.fetch, url, params, key, **kwargs)
+
+    def connect(self):
+        r"""
+        Return the pooled session, creating it on first use
+
+        requests is only imported here, so runs that never go upstream do
+        not pay for loading it.
+        """
+        with self.lock:
+            if self.session is None:
+                from requests import Session
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                session = Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=Retry(
+                        total=self.retries,
+                        backoff_factor=self.backoff,
+                        status_forcelist=(500, 502, 503, 504),
+                        method_whitelist=('GET', 'HEAD'),
+                        raise_on_status=False))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.session = session
+            return self.session
+
+    def fetch(self, url, params=None, key=None, **kwargs):
+        breaker = self.breakers.breaker(url)
+        if not breaker.allow():
+            raise UpstreamDown(urlsplit(url).netloc)
+        self.throttle(url)
+        kwargs.setdefault('timeout', (self.connect_timeout, self.timeout))
+        try:
+            r = self.connect().get(url, params=params, **kwargs)
+        except IOError:
+            breaker.failure()
+            raise
+        if r.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        if key is not None and self.cache is not None and \
+                r.status_code == 200:
+            r = CachedResponse.from_response(r)
+            self.cache.set(key, r)
+        return r
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,146 @@
+from cache import cache_key
+from metrics import METRICS
+
+# Console API root, by platform
+API_URLS = {
+    'ps': 'https://api-ps4-console.worldoftanks.com/wotx/',
+    'xbox': 'https://api-xbox-console.worldoftanks.com/wotx/',
+}
+# Most names or account IDs the API accepts in one request
+BATCH = 100
+# Per-vehicle statistics requested from tanks/stats
+TANK_FIELDS = (
+    'tank_id', 'all.battles', 'all.wins', 'all.damage_dealt', 'all.frags',
+    'all.spotted', 'all.dropped_capture_points', 'all.capture_points')
+
+
+class WargamingError(Exception):
+    r"""
+    The Wargaming API could not answer a request
+
+    :param str message: What went wrong, e.g. the API's error message
+    """
+
+
+def chunks(items, size=BATCH):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class WargamingAPI(object):
+    r"""
+    Client for the World of Tanks Console API
+
+    Names are resolved to account IDs with one ``account/list`` request per
+    hundred names, and the IDs are remembered in the response cache, as they
+    never change. Account and per-vehicle statistics come back as decoded
+    JSON, so no page needs to be scraped.
+
+    :param str application_id: Application ID ("WG API" in the configuration)
+    :param dict urls: API root, by platform
+    """
+
+    def __init__(self, application_id='demo', urls=API_URLS):
+        self.application_id = application_id
+        self.urls = urls
+
+    async def call(self, session, platform, method, key=None, **params):
+        r"""
+        Send a request and return the ``data`` of its answer
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name, e.g. ``xbox``
+        :param str method: API method, e.g. ``account/list``
+        :param tuple key: Optional cache key for the response
+        :param params: Query string parameters
+        :raises WargamingError: On an HTTP error or an error answer
+        """
+        params['application_id'] = self.application_id
+        r = await session.get(
+            '{}{}/'.format(self.urls[platform], method), params=params,
+            key=key)
+        if r.status_code != 200:
+            raise WargamingError(
+                'The Wargaming API answered with error code {}'.format(
+                    r.status_code))
+        with METRICS.timer('decode'):
+            answer = r.json()
+        if answer.get('status') != 'ok':
+            error = answer.get('error') or {}
+            raise WargamingError('The Wargaming API refused {}: {}'.format(
+                method, error.get('message', 'UNKNOWN_ERROR')))
+        return answer['data']
+
+    async def account_ids(self, session, platform, names):
+        r"""
+        Resolve player names to account IDs
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name
+        :param names: Player names
+        :return: Account ID by name, for every name that was found. Names are
+                 matched regardless of case.
+        """
+        found = {}
+        missing = []
+        for name in names:
+            known = None
+            if session.cache is not None:
+                known = session.cache.get(
+                    cache_key('accountid', platform, name))
+            if known is None:
+                missing.append(name)
+            else:
+                found[name] = known
+        for batch in chunks(missing):
+            wanted = {name.lower(): name for name in batch}
+            data = await self.call(
+                session, platform, 'account/list', search=','.join(batch),
+                type='exact', limit=BATCH)
+            for account in data or ():
+                name = wanted.get(account['nickname'].lower())
+                if name is None:
+                    continue
+                found[name] = account['account_id']
+                if session.cache is not None:
+                    session.cache.set(
+                        cache_key('accountid', platform, name),
+                        account['account_id'])
+        return found
+
+    async def accounts(self, session, platform, account_ids, fields=None):
+        r"""
+        Fetch the account details of several players
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name
+        :param account_ids: Account IDs
+        :param str fields: Optional comma-separated fields to return
+        :return: Account details by account ID. Unknown accounts map to
+                 ``None``.
+        """
+        found = {}
+        extra = {} if fields is None else {'fields': fields}
+        for batch in chunks(list(account_ids)):
+            data = await self.call(
+                session, platform, 'account/info',
+                account_id=','.join(str(id) for id in batch), **extra)
+            for id in batch:
+                found[id] = data.get(str(id))
+        return found
+
+    async def tank_stats(self, session, platform, account_id):
+        r"""
+        Fetch a player's statistics for every vehicle they have played
+
+        :param session: :class:`aiotransport.AsyncTransport` to fetch with
+        :param str platform: Platform name
+        :param int account_id: Account ID
+        :return: List of per-vehicle statistics, or ``None`` if the account
+                 does not exist
+        """
+        data = await self.call(
+            session, platform, 'tanks/stats',
+            key=cache_key('tankstats', platform, str(account_id)),
+            account_id=account_id, fields=','.join(TANK_FIELDS))
+        return data.get(str(account_id))
@@ -0,0 +1,137 @@
+from functools import lru_cache
+from importlib.util import find_spec
+from urllib.parse import urlsplit, parse_qs
+
+from cache import cache_key
+from metrics import METRICS
+
+# Tree builder used unless another is asked for. Looked up without importing
+# lxml, which is only loaded by the first parse.
+PARSER = 'lxml' if find_spec('lxml') is not None else 'html.parser'
+
+EFFICIENCY_URL = 'http://www.wotinfo.net/en/efficiency'
+VEHICLES_URL = 'http://wotinfo.net/en/vehicles'
+RECENT_URL = 'http://wotinfo.net/en/recent'
+TREND_URL = 'http://wotinfo.net/en/trend'
+
+
+def tags(name, *classes):
+    r"""
+    Describe the tags with a given name and any of the given classes
+
+    :param str name: Tag name
+    :param str classes: Class names, any one of which must be present. Any
+                        class, or none, is accepted when omitted.
+    :return: Tuple of the name and the set of classes
+    """
+    return name, frozenset(classes)
+
+
+@lru_cache(maxsize=None)
+def strainer(*parts):
+    r"""
+    Only keep the subtrees of tags described by one of the parts
+
+    The strainer is built from plain ``name`` and ``attrs`` filters, which
+    every version of BeautifulSoup accepts. They cannot tie a class to a tag
+    name, so when several parts are given a tag is kept if it has one of the
+    names and one of the classes. If any part accepts every class, the class
+    is not checked at all.
+
+    :param parts: Tags described with :func:`tags`
+    """
+    from bs4 import SoupStrainer
+    names = sorted({name for name, _ in parts})
+    if not all(classes for _, classes in parts):
+        return SoupStrainer(names)
+    wanted = frozenset().union(*(classes for _, classes in parts))
+
+    def has_class(found):
+        # Given the whole attribute, or one class at a time
+        if found is None:
+            return False
+        if isinstance(found, str):
+            found = found.split()
+        return not wanted.isdisjoint(found)
+    return SoupStrainer(names, attrs={'class': has_class})
+
+
+# The parts of each page the handlers actually read. BeautifulSoup is only
+# imported once a page is parsed, so these are kept as plain tuples.
+SUMMARY_PARTS = (tags('var'), tags('li', 'activemenu'))
+RECENT_PARTS = (tags('div', 'my_plan1', 'my_plan2', 'my_feature'),)
+TREND_PARTS = (tags('ul', 'event-list'),)
+
+
+def parse_page(content, parts=None, parser=None):
+    r"""
+    Parse a wotinfo page, keeping only the parts we are interested in
+
+    :param bytes content: Page source
+    :param tuple parts: Tags described with :func:`tags`, selecting the
+                        subtrees to keep. The whole document is parsed when
+                        omitted.
+    :param str parser: BeautifulSoup tree builder. Defaults to lxml when it
+                       is installed and the standard library parser otherwise.
+    """
+    from bs4 import BeautifulSoup
+    with METRICS.timer('decode'):
+        return BeautifulSoup(
+            content, parser or PARSER,
+            parse_only=strainer(*parts) if parts else None)
+
+
+def find_player_id(soup):
+    r"""
+    Extract the wotinfo player ID from a parsed efficiency page
+
+    :param soup: Parsed efficiency page
+    :return: Player ID, or ``None`` if the page is not a player's page
+    """
+    menu = soup.find('li', class_='activemenu')
+    if menu is None or menu.a is None:
+        return None
+    try:
+        return parse_qs(urlsplit(menu.a['href']).query)['playerid'][0]
+    except KeyError:
+        return None
+
+
+async def player_page(session, platform, name):
+    r"""
+    Fetch and parse a player's efficiency page
+
+    The page is parsed once and the player ID found on it is remembered, so
+    later requests for the same player can skip this page entirely.
+
+    :param session: :class:`aiotransport.AsyncTransport` to fetch with
+    :param str platform: wotinfo server name
+    :param str name: Player name
+    :return: Tuple of response, parsed page and player ID. The last two are
+             ``None`` when the request failed.
+    """
+    r = await session.get(
+        EFFICIENCY_URL,
+        params={'server': platform, 'playername': name},
+        key=cache_key('efficiency', platform, name))
+    if r.status_code != 200:
+        return r, None, None
+    soup = parse_page(r.content, SUMMARY_PARTS)
+    playerid = find_player_id(soup)
+    if playerid is not None and session.cache is not None:
+        session.cache.set(cache_key('playerid', platform, name), playerid)
+    return r, soup, playerid
+
+
+def known_player_id(session, platform, name):
+    r"""
+    Return the remembered player ID for a name without any network access
+
+    :param session: :class:`aiotransport.AsyncTransport` whose cache holds
+                    the IDs
+    :param str platform: wotinfo server name
+    :param str name: Player name
+    """
+    if session.cache is None:
+        return None
+    return session.cache.get(cache_key('playerid', platform, name))